@@ -0,0 +1,92 @@
+import json
+import os
+
+from epd import load_puzzles
+from preflight import take_engine
+
+
+def _format_score(score):
+    if score is None:
+        return None
+    try:
+        return {"type": score["type"], "value": int(score["value"])}
+    except ValueError:
+        return dict(score)
+
+
+def analyze_position(engine, puzzle_info, movetime):
+    engine.give_fen(puzzle_info['fen'])
+    move, duration = engine.go_w_movetime(movetime)
+
+    lines = []
+    for rank in sorted(engine.multipv):
+        info = engine.multipv[rank]
+        lines.append({
+            "rank": rank,
+            "move": info["pv"][0],
+            "score": _format_score(info.get("score")),
+            "depth": int(info["depth"]) if "depth" in info else None,
+            "seldepth": int(info["seldepth"]) if "seldepth" in info else None,
+            "nodes": int(info["nodes"]) if "nodes" in info else None,
+            "pv": info["pv"],
+        })
+
+    # where (if anywhere) the expected best move landed in the ranking
+    bm_rank = None
+    best_moves = puzzle_info.get('best_move')
+    if best_moves:
+        for line in lines:
+            if line["move"] in best_moves:
+                bm_rank = line["rank"]
+                break
+
+    return {
+        "id": puzzle_info.get('id', 'unknown'),
+        "fen": puzzle_info['fen'],
+        "bestmove": move,
+        "time": duration,
+        "best_move": sorted(best_moves) if best_moves else None,
+        "bm_rank": bm_rank,
+        "lines": lines,
+    }
+
+
+def run_analysis(settings):
+    hero = settings.engine
+    puzzle_file = settings.puzzle_suite
+    movetime = settings.puzzle_movetime
+    multipv = settings.analysis_multipv
+    output = settings.analysis_output
+
+    # MultiPV goes in with the rest of the options so it survives restarts
+    engine_settings = dict(settings.engine_settings)
+    engine_settings["MultiPV"] = multipv
+    engine = take_engine(hero, engine_settings)
+
+    print("Starting MultiPV analysis")
+    print(f"Puzzle file: {os.path.basename(puzzle_file)}")
+    print(f"Time per position: {movetime} ms, MultiPV: {multipv}")
+    print(f"Writing results to {output}")
+
+    puzzles = load_puzzles(puzzle_file, settings.cache_dir)
+    with_bm = 0
+    top1, topk = 0, 0
+    with open(output, "w") as f:
+        for puzzle_info in puzzles:
+            record = analyze_position(engine, puzzle_info, movetime)
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+
+            if record["best_move"] is not None:
+                with_bm += 1
+                if record["bm_rank"] == 1:
+                    top1 += 1
+                if record["bm_rank"] is not None:
+                    topk += 1
+            print(f"{record['id']}: {record['bestmove']} ({len(record['lines'])} lines, bm rank {record['bm_rank']})")
+
+    if with_bm:
+        print(f"bm found as top move: {top1} / {with_bm}")
+        print(f"bm found in top {multipv}: {topk} / {with_bm}")
+
+    return topk, with_bm
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import pickle
+import queue
+import threading
+import time
+
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+
+from engine import EngineError
+from preflight import take_engine
+from resources import allocate_slots
+
+# games are read, searched and written this many at a time, so positions
+# repeated between games of a batch (openings, mostly) are searched once
+BATCH_GAMES = 64
+
+ANNOTATE_FORMATS = ("pgn", "jsonl")
+
+
+def _cache_fname(cache_dir, engine, budget):
+    # a rebuilt binary or different options (another EvalFile, say) gives
+    # different evals, so they all go into the key along with the name
+    stat = os.stat(engine.path)
+    identity = json.dumps([engine.full_name, stat.st_size, stat.st_mtime_ns, engine.settings, budget],
+                          sort_keys=True, default=str)
+    digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"annotate_{os.path.basename(engine.path)}_{budget}_{digest}.pkl")
+
+
+def load_eval_cache(fname):
+    # {zobrist key: {"score": ..., "depth": ..., "pv": [...]}}
+    if fname is None or not os.path.isfile(fname):
+        return {}
+    try:
+        with open(fname, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        print(f"Ignoring unreadable annotation cache {fname}")
+        return {}
+
+
+def save_eval_cache(fname, cache):
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    tmp_fname = f"{fname}.tmp"
+    with open(tmp_fname, "wb") as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fname, fname)
+
+
+def evaluate_position(engine, fen, nodes, movetime):
+    engine.give_fen(fen)
+    if movetime is not None:
+        engine.go_w_movetime(movetime)
+    else:
+        engine.go_w_nodes(nodes)
+    info = engine.multipv.get(1, engine.info)
+    score = info.get("score")
+    return {
+        "score": {"type": score["type"], "value": int(score["value"])} if score else None,
+        "depth": int(info["depth"]) if "depth" in info else None,
+        "pv": info.get("pv", []),
+    }
+
+
+def _annotate_worker(engine_fname, engine_settings, slot, nodes, movetime, tasks, evals, engine=None):
+    try:
+        if engine is None:
+            engine = take_engine(engine_fname, slot.options(engine_settings), cpus=slot.affinity())
+    except Exception as e:
+        # keep taking tasks so a batch never waits on this worker forever
+        print(f"Couldn't start {engine_fname} ({e}), its worker is stopping")
+        engine = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        key, fen = task
+        try:
+            if engine is not None:
+                evals[key] = evaluate_position(engine, fen, nodes, movetime)
+        except (EngineError, BrokenPipeError):
+            # the position goes unannotated, the rest of the batch carries on
+            print(f"{engine.name} exited ({engine.kill_reason or 'crash'}) on {fen}")
+            try:
+                engine.restart()
+            except Exception as e:
+                print(f"Couldn't restart {engine.name} ({e}), its worker is stopping")
+                engine = None
+        finally:
+            tasks.task_done()
+
+
+def _positions(game):
+    # (node, board after the node's move, zobrist key) along the mainline
+    board = game.board()
+    for node in game.mainline():
+        board.push(node.move)
+        yield node, board.copy(stack=False), chess.polyglot.zobrist_hash(board)
+
+
+def _pov_score(score, turn):
+    # uci scores are from the side to move, pgn evals from white
+    if score["type"] == "mate":
+        return chess.engine.PovScore(chess.engine.Mate(score["value"]), turn)
+    return chess.engine.PovScore(chess.engine.Cp(score["value"]), turn)
+
+
+def _pv_san(board, pv):
+    # engines occasionally print pvs that run past a legal line, keep the
+    # legal prefix
+    line = board.copy(stack=False)
+    moves = []
+    for uci in pv:
+        try:
+            move = chess.Move.from_uci(uci)
+        except ValueError:
+            break
+        if not line.is_legal(move):
+            break
+        moves.append(move)
+        line.push(move)
+    return board.variation_san(moves) if moves else ""
+
+
+def annotate_game(game, evals):
+    for node, board, key in _positions(game):
+        entry = evals.get(key)
+        if entry is None or entry["score"] is None:
+            continue
+        node.set_eval(_pov_score(entry["score"], board.turn), entry["depth"])
+        pv = _pv_san(board, entry["pv"])
+        if pv:
+            node.comment = f"{node.comment} {pv}".strip()
+
+
+def game_records(game_idx, game, evals):
+    records = []
+    for ply, (node, board, key) in enumerate(_positions(game), start=1):
+        entry = evals.get(key, {})
+        records.append({
+            "game": game_idx,
+            "ply": ply,
+            "move": node.move.uci(),
+            "fen": board.fen(),
+            "score": entry.get("score"),
+            "depth": entry.get("depth"),
+            "pv": entry.get("pv"),
+        })
+    return records
+
+
+def _read_batch(f):
+    games = []
+    while len(games) < BATCH_GAMES:
+        game = chess.pgn.read_game(f)
+        if game is None:
+            break
+        games.append(game)
+    return games
+
+
+def annotate_pgn(engine_fname, engine_settings, pgn_fname, output, out_format, nodes, movetime,
+                 slots, cache_fname=None, first_engine=None):
+    # `first_engine`, if given, is already running in the first slot
+    evals = load_eval_cache(cache_fname)
+    cached = len(evals)
+
+    tasks = queue.Queue()
+    workers = [threading.Thread(
+        target=_annotate_worker,
+        args=(engine_fname, engine_settings, slot, nodes, movetime, tasks, evals, first_engine if i == 0 else None),
+        daemon=True) for i, slot in enumerate(slots)]
+    for worker in workers:
+        worker.start()
+
+    games, positions, searched = 0, 0, 0
+    try:
+        with open(pgn_fname, errors="replace") as f, open(output, "w") as out:
+            while True:
+                batch = _read_batch(f)
+                if not batch:
+                    break
+
+                # only positions nobody has evaluated yet go to the engines
+                queued = set()
+                for game in batch:
+                    for _, board, key in _positions(game):
+                        positions += 1
+                        if key in evals or key in queued or board.is_game_over():
+                            continue
+                        queued.add(key)
+                        tasks.put((key, board.fen()))
+                tasks.join()
+                searched += len(queued)
+
+                # written in input order, whatever order the searches finished in
+                for game in batch:
+                    if out_format == "pgn":
+                        game.headers["Annotator"] = os.path.basename(engine_fname)
+                        annotate_game(game, evals)
+                        print(game, file=out, end="\n\n")
+                    else:
+                        for record in game_records(games, game, evals):
+                            out.write(json.dumps(record) + "\n")
+                    games += 1
+                out.flush()
+                print(f"Annotated {games} games, {positions} positions ({searched} searched)")
+    finally:
+        for _ in workers:
+            tasks.put(None)
+        if cache_fname is not None and len(evals) > cached:
+            save_eval_cache(cache_fname, evals)
+
+    return games, positions, searched
+
+
+def run_annotate(settings):
+    engine_fname = settings.engine
+    nodes = settings.annotate_nodes
+    movetime = settings.annotate_movetime
+    workers = settings.annotate_workers or settings.concurrency
+    budget = f"{movetime}ms" if movetime is not None else f"{nodes}n"
+    slots = allocate_slots(workers, engines_per_slot=1, memory_budget_mb=settings.memory_budget_mb,
+                           pin=settings.pin_cpus)
+
+    # one engine up front, the cache key depends on what it says it is
+    first_engine = take_engine(engine_fname, slots[0].options(settings.engine_settings), cpus=slots[0].affinity())
+    cache_fname = None
+    if settings.cache_dir is not None:
+        cache_fname = _cache_fname(settings.cache_dir, first_engine, budget)
+
+    print("Starting annotation")
+    print(f"PGN file: {os.path.basename(settings.annotate_pgn)}")
+    print(f"Budget per position: {movetime} ms" if movetime is not None else f"Budget per position: {nodes} nodes")
+    print(f"Engines: {len(slots)}, writing {settings.annotate_format} to {settings.annotate_output}")
+
+    start_time = time.time()
+    games, positions, searched = annotate_pgn(
+        engine_fname,
+        settings.engine_settings,
+        settings.annotate_pgn,
+        settings.annotate_output,
+        settings.annotate_format,
+        nodes,
+        movetime,
+        slots,
+        cache_fname,
+        first_engine)
+
+    elapsed = time.time() - start_time
+    print(f"Searched {searched} of {positions} positions in {elapsed:.1f}s "
+          f"({searched / elapsed if elapsed else 0.:.1f} positions/sec)")
+
+    return games, positions
@@ -0,0 +1,171 @@
+import json
+import os
+import statistics
+import time
+
+from engine import Engine
+from epd import load_puzzles
+
+# a spread of openings, middlegames and endgames.  changing this list
+# makes new results incomparable with old ones, so don't do it lightly
+BENCH_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 10",
+    "r1bq1rk1/pp2bppp/2n1pn2/2pp4/3P4/2PBPN2/PP1N1PPP/R1BQ1RK1 w - - 0 8",
+    "r2q1rk1/1b1nbppp/p2ppn2/1p6/3NP3/1BN1BP2/PPPQ2PP/2KR3R w - - 0 12",
+    "2rq1rk1/pp1bppbp/3p1np1/4n3/3NP3/1BN1BP2/PPPQ2PP/2KR3R w - - 0 13",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+    "8/8/1p2k1p1/3p3p/1p1P1P1P/1P2PK2/8/8 w - - 0 50",
+    "4rrk1/1p1nq3/p7/2p1P1pp/3P2bp/3Q1Bn1/PPPB4/1K2R1NR w - - 0 40",
+]
+
+
+def _power_of_two_threads(max_threads):
+    threads = []
+    t = 1
+    while t < max_threads:
+        threads.append(t)
+        t *= 2
+    threads.append(max_threads)
+    return threads
+
+
+def bench_position(engine, fen, depth, movetime):
+    engine.new_game()
+    engine.is_ready()
+    engine.give_fen(fen)
+    if depth is not None:
+        _, duration = engine.go_w_depth(depth)
+    else:
+        _, duration = engine.go_w_movetime(movetime)
+
+    stats = engine.search_stats
+    nodes = stats.get("nodes", 0)
+    # prefer the engine's own clock, it doesn't include pipe latency
+    search_time = stats.get("time", duration)
+    depth_times = stats.get("depth_times", {})
+    return {
+        "fen": fen,
+        "nodes": nodes,
+        "time": search_time,
+        "nps": int(nodes * 1000 / search_time) if search_time else stats.get("nps", 0),
+        "depth": stats.get("depth"),
+        "time_to_depth": depth_times.get(depth) if depth is not None else None,
+    }
+
+
+def bench_config(engine_fname, engine_settings, positions, threads, hash_mb, depth, movetime):
+    options = dict(engine_settings)
+    options["Threads"] = threads
+    options["Hash"] = hash_mb
+    engine = Engine(engine_fname, options)
+
+    results = [bench_position(engine, fen, depth, movetime) for fen in positions]
+    nodes = sum(r["nodes"] for r in results)
+    search_time = sum(r["time"] for r in results)
+    time_to_depth = None
+    if depth is not None and all(r["time_to_depth"] is not None for r in results):
+        time_to_depth = sum(r["time_to_depth"] for r in results)
+
+    return {
+        "nodes": nodes,
+        "time": search_time,
+        "nps": int(nodes * 1000 / search_time) if search_time else 0,
+        "time_to_depth": time_to_depth,
+        "positions": results,
+    }
+
+
+def _summarize(runs):
+    nps = [r["nps"] for r in runs]
+    ttd = [r["time_to_depth"] for r in runs if r["time_to_depth"] is not None]
+    return {
+        "nodes": int(statistics.mean(r["nodes"] for r in runs)),
+        "nps": int(statistics.mean(nps)),
+        "nps_stdev": int(statistics.stdev(nps)) if len(nps) > 1 else 0,
+        "time_to_depth": int(statistics.mean(ttd)) if ttd else None,
+    }
+
+
+def print_bench_table(results, baseline=None):
+    baseline_nps = {}
+    if baseline is not None:
+        for row in baseline["configs"]:
+            baseline_nps[(row["threads"], row["hash"])] = row["summary"]["nps"]
+
+    single_thread_nps = {}
+    for row in results["configs"]:
+        if row["threads"] == 1:
+            single_thread_nps[row["hash"]] = row["summary"]["nps"]
+
+    header = f"{'threads':>7} {'hash':>6} {'nodes':>12} {'nps':>10} {'+/-':>8} {'speedup':>8} {'ttd ms':>8}"
+    if baseline_nps:
+        header += f" {'vs base':>8}"
+    print(header)
+    for row in results["configs"]:
+        summary = row["summary"]
+        base = single_thread_nps.get(row["hash"])
+        speedup = f"{summary['nps'] / base:.2f}x" if base else "-"
+        ttd = summary["time_to_depth"] if summary["time_to_depth"] is not None else "-"
+        line = f"{row['threads']:>7} {row['hash']:>6} {summary['nodes']:>12} {summary['nps']:>10} {summary['nps_stdev']:>8} {speedup:>8} {ttd:>8}"
+        if baseline_nps:
+            old_nps = baseline_nps.get((row["threads"], row["hash"]))
+            line += f" {summary['nps'] / old_nps:>7.3f}x" if old_nps else f" {'-':>8}"
+        print(line)
+
+
+def run_bench(settings):
+    hero = settings.engine
+    depth = settings.bench_depth
+    movetime = settings.bench_movetime if depth is None else None
+    max_threads = settings.bench_max_threads or os.cpu_count() or 1
+    thread_counts = _power_of_two_threads(max_threads)
+    hash_sizes = settings.bench_hash
+    repeats = settings.bench_repeats
+
+    if settings.bench_positions is not None:
+        positions = [p['fen'] for p in load_puzzles(settings.bench_positions, settings.cache_dir)]
+    else:
+        positions = BENCH_POSITIONS
+
+    print("Starting engine bench")
+    print(f"Positions: {len(positions)}, " + (f"depth {depth}" if depth is not None else f"movetime {movetime} ms"))
+    print(f"Threads: {thread_counts}, Hash: {hash_sizes}, repeats: {repeats}")
+
+    results = {
+        "engine": hero,
+        "depth": depth,
+        "movetime": movetime,
+        "positions": positions,
+        "timestamp": int(time.time()),
+        "configs": [],
+    }
+    for hash_mb in hash_sizes:
+        for threads in thread_counts:
+            runs = []
+            for r in range(repeats):
+                run = bench_config(hero, settings.engine_settings, positions, threads, hash_mb, depth, movetime)
+                runs.append(run)
+                print(f"threads {threads} hash {hash_mb} run {r + 1}: {run['nodes']} nodes, {run['nps']} nps")
+            results["configs"].append({
+                "threads": threads,
+                "hash": hash_mb,
+                "summary": _summarize(runs),
+                "runs": runs,
+            })
+
+    baseline = None
+    if settings.bench_compare is not None:
+        with open(settings.bench_compare) as f:
+            baseline = json.load(f)
+
+    print()
+    print_bench_table(results, baseline)
+
+    with open(settings.bench_output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Bench results saved to {settings.bench_output}")
+
+    return results
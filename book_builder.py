@@ -0,0 +1,223 @@
+import io
+import multiprocessing
+import os
+import struct
+import time
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+# polyglot entries: key, move, weight, learn.  big endian, sorted by key
+ENTRY_STRUCT = struct.Struct(">QHHI")
+MAX_WEIGHT = 0xffff
+
+# games are split between workers in chunks of at least this many bytes
+MIN_CHUNK_SIZE = 32 * 1024 * 1024
+
+RESULT_FILTERS = ("all", "no-losses", "wins")
+RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}
+
+
+def polyglot_move(board, move):
+    # polyglot spells castling as the king taking its own rook
+    if board.is_castling(move):
+        rook_file = 7 if chess.square_file(move.to_square) > chess.square_file(move.from_square) else 0
+        to_square = chess.square(rook_file, chess.square_rank(move.from_square))
+    else:
+        to_square = move.to_square
+    promotion = move.promotion - 1 if move.promotion else 0
+    return (chess.square_file(to_square)
+            | chess.square_rank(to_square) << 3
+            | chess.square_file(move.from_square) << 6
+            | chess.square_rank(move.from_square) << 9
+            | promotion << 12)
+
+
+class _BookVisitor(chess.pgn.BaseVisitor):
+    # collects (zobrist key, polyglot move, side to move) for the opening
+    # of the mainline only, without parsing moves past max_ply
+    def __init__(self, max_ply):
+        self.max_ply = max_ply
+
+    def begin_game(self):
+        self.game_result = "*"
+        self.ply = 0
+        self.entries = []
+        self.failed = False
+
+    def visit_header(self, tagname, tagvalue):
+        if tagname == "Result":
+            self.game_result = tagvalue
+
+    def visit_result(self, result):
+        # the termination marker, for games missing a Result tag
+        if self.game_result == "*":
+            self.game_result = result
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def begin_parse_san(self, board, san):
+        if self.ply >= self.max_ply:
+            return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        if self.ply < self.max_ply:
+            key = chess.polyglot.zobrist_hash(board)
+            self.entries.append((key, polyglot_move(board, move), board.turn))
+        self.ply += 1
+
+    def handle_error(self, error):
+        self.failed = True
+
+    def result(self):
+        return self.game_result, self.entries, self.failed
+
+
+def add_game(table, game_result, entries, result_filter):
+    points = RESULT_POINTS.get(game_result)
+    if points is None:
+        # unfinished or unknown result, nothing to learn
+        return False
+    white_points, black_points = points
+    for key, move, turn in entries:
+        mover_points = white_points if turn == chess.WHITE else black_points
+        if result_filter == "wins" and mover_points != 2:
+            continue
+        if result_filter == "no-losses" and mover_points == 0:
+            continue
+        # game count in the high bits, points in the low bits, so one
+        # int per (position, move) holds both
+        idx = (key << 16) | move
+        table[idx] = table.get(idx, 0) + ((1 << 32) | mover_points)
+    return True
+
+
+def _read_game_text(f, start, end):
+    # yields the raw text of every game whose tag section begins inside the
+    # chunk.  not every pgn has [Event tags, so a game starts at any tag
+    # line after a blank line, and belongs to the chunk holding that blank
+    # line (the file's first game has none and goes to the first chunk)
+    if start > 0:
+        f.seek(start - 1)
+        if f.read(1) != b"\n":
+            # the rest of a line the chunk before has
+            f.readline()
+    lines = []
+    owned = start == 0
+    blank_start = None
+    while True:
+        line_start = f.tell()
+        line = f.readline()
+        if not line:
+            break
+        if blank_start is not None and line.startswith(b"["):
+            if owned and lines:
+                yield b''.join(lines).decode("utf-8", errors="replace")
+            if blank_start >= end:
+                return
+            lines = []
+            owned = True
+        blank_start = line_start if not line.strip() else None
+        if owned:
+            lines.append(line)
+    if owned and lines:
+        yield b''.join(lines).decode("utf-8", errors="replace")
+
+
+def _build_chunk(fname, start, end, max_ply, result_filter):
+    table = {}
+    games, skipped = 0, 0
+    visitor = _BookVisitor(max_ply)
+    with open(fname, "rb") as f:
+        for text in _read_game_text(f, start, end):
+            game_result, entries, failed = chess.pgn.read_game(io.StringIO(text), Visitor=lambda: visitor)
+            if failed or not add_game(table, game_result, entries, result_filter):
+                skipped += 1
+            else:
+                games += 1
+    return table, games, skipped
+
+
+def _chunks(fnames, workers):
+    chunks = []
+    for fname in fnames:
+        size = os.path.getsize(fname)
+        count = max(1, min(workers, size // MIN_CHUNK_SIZE))
+        bounds = [size * i // count for i in range(count + 1)]
+        chunks += [(fname, bounds[i], bounds[i + 1]) for i in range(count)]
+    return chunks
+
+
+def write_book(table, fname, min_games):
+    # group by key, drop rare and pointless moves, and scale weights so the
+    # most popular move of each position fits in 16 bits
+    positions = {}
+    for idx, value in table.items():
+        count, points = value >> 32, value & 0xffffffff
+        if count < min_games or points == 0:
+            continue
+        positions.setdefault(idx >> 16, []).append((points, idx & 0xffff))
+
+    entries = 0
+    with open(fname, "wb") as f:
+        for key in sorted(positions):
+            moves = sorted(positions[key], reverse=True)
+            scale = MAX_WEIGHT / moves[0][0] if moves[0][0] > MAX_WEIGHT else 1.
+            for points, move in moves:
+                weight = max(1, int(points * scale))
+                f.write(ENTRY_STRUCT.pack(key, move, weight, 0))
+                entries += 1
+    return len(positions), entries
+
+
+def build_book(fnames, output, max_ply, min_games, result_filter, workers):
+    chunks = _chunks(fnames, workers)
+    tasks = [(fname, start, end, max_ply, result_filter) for fname, start, end in chunks]
+
+    table = {}
+    games, skipped = 0, 0
+    if len(tasks) == 1:
+        results = [_build_chunk(*tasks[0])]
+    else:
+        with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+            results = pool.starmap(_build_chunk, tasks)
+
+    for chunk_table, chunk_games, chunk_skipped in results:
+        games += chunk_games
+        skipped += chunk_skipped
+        if not table:
+            table = chunk_table
+            continue
+        for idx, value in chunk_table.items():
+            table[idx] = table.get(idx, 0) + value
+
+    positions, entries = write_book(table, output, min_games)
+    return games, skipped, positions, entries
+
+
+def run_build_book(settings):
+    fnames = settings.book_pgns
+    output = settings.book_output
+    workers = settings.book_workers or settings.concurrency
+
+    print("Building opening book")
+    print(f"PGN files: {', '.join(os.path.basename(f) for f in fnames)}")
+    print(f"Max ply: {settings.book_max_ply}, min games: {settings.book_min_games}, "
+          f"results: {settings.book_results}, workers: {workers}")
+
+    start_time = time.time()
+    games, skipped, positions, entries = build_book(
+        fnames,
+        output,
+        settings.book_max_ply,
+        settings.book_min_games,
+        settings.book_results,
+        workers)
+
+    elapsed = time.time() - start_time
+    print(f"Read {games} games ({skipped} skipped) in {elapsed:.1f}s")
+    print(f"Wrote {entries} moves for {positions} positions to {output}")
+
+    return positions, entries
@@ -0,0 +1,64 @@
+from bench import BENCH_POSITIONS, bench_config
+
+# settings that are a length of time and get stretched or shrunk to
+# match the reference machine
+TIME_SETTINGS = ("clock_time", "clock_inc", "elo_clock_time", "elo_inc", "puzzle_movetime")
+
+# single threaded with a small fixed hash, so the number only depends on
+# the machine and not on how many cores or how much memory it has
+CALIBRATION_THREADS = 1
+CALIBRATION_HASH = 16
+
+
+def measure_nps(engine_fname, movetime):
+    # none of the tested engine's options, they'd make the reference
+    # figure depend on whatever is being tuned this week
+    result = bench_config(
+        engine_fname,
+        {},
+        BENCH_POSITIONS,
+        CALIBRATION_THREADS,
+        CALIBRATION_HASH,
+        None,
+        movetime)
+    return result["nps"]
+
+
+def scale_time_controls(settings, factor):
+    for key in TIME_SETTINGS:
+        value = getattr(settings, key, None)
+        # zero stays zero, a sudden death control has no increment to scale
+        if value:
+            setattr(settings, key, max(1, int(round(value * factor))))
+
+
+def calibrate(settings):
+    engine_fname = settings.calibration_engine or settings.engine
+    movetime = settings.calibration_movetime
+
+    print(f"Calibrating machine speed with {engine_fname} ({movetime} ms per position)")
+    nps = measure_nps(engine_fname, movetime)
+    print(f"Local speed: {nps} nps")
+
+    if not settings.reference_nps:
+        print("No reference nps given, time controls left as they are.  "
+              f"Use this figure as --reference-nps with --calibration-engine {engine_fname} "
+              "to normalize other machines to this one.")
+        return nps, 1.
+
+    if not nps:
+        print("Calibration engine reported no nodes, time controls left as they are.")
+        return nps, 1.
+
+    # slower machines get proportionally more time, so every host
+    # searches about the same number of nodes per move
+    factor = settings.reference_nps / nps
+    scale_time_controls(settings, factor)
+    print(f"Reference speed: {settings.reference_nps} nps, scaling time controls by {factor:.3f}")
+    for key in TIME_SETTINGS:
+        value = getattr(settings, key, None)
+        if value is not None:
+            print(f"  {key}: {value} ms")
+    print()
+
+    return nps, factor
@@ -2,7 +2,6 @@
 
 import argparse
 import os
-import re
 import subprocess
 import sys
 import time
@@ -10,8 +9,20 @@ import time
 import chess
 import chess.polyglot
 
-from board import BoardPrinter
-from engine import Engine, kill_all_engines
+from analysis import run_analysis
+from annotate import run_annotate
+from bench import run_bench
+from book_builder import run_build_book
+from calibration import calibrate
+from engine import EngineError, kill_all_engines
+from epd import load_puzzles, puzzle_theme, score_move
+from games import run_game
+from harness_bench import run_harness_bench
+from monitor import format_summary, start_monitor
+from perft import run_perft
+from preflight import run_preflight, take_engine
+from resources import allocate_slots, run_in_slots
+from selfplay import run_selfplay
 import suite_settings
 
 
@@ -36,142 +47,78 @@ def get_new_elo(elo1, elo2, result):
     return new_elo1, new_elo2
 
 
-def run_game(e1, e2, clock_time, inc, starting_moves=[]):
-    # should return winner and num moves
-    # 1 means white wins, 0.5 means draw, 0 means black wins
-    moves = starting_moves[:]
-    board = chess.Board()
-    for move in moves:
-        board.push(move)
-
-    board_printer = BoardPrinter(active=False, initial_board=board)
-    e1.set_printer(board_printer)
-    e2.set_printer(board_printer)
-
-    engines = (e1, e2)
-
-    side_to_move = "white" if len(moves) % 2 == 0 else "black"
-    engine_to_move = engines[0] if side_to_move == "white" else engines[1]
-    # white clock, black clock
-    clocks = [clock_time, clock_time]
-    while True:
-        board_printer.update(board, previous_move=str(moves[-1]) if len(moves) else None)
-        if board.is_stalemate():
-            return 0.5, len(moves) // 2, "stalemate"
-        if board.is_insufficient_material():
-            return 0.5, len(moves) // 2, "insufficient_material"
-        if board.can_claim_draw():
-            return 0.5, len(moves) // 2, "claimable draw"
-        if board.is_checkmate():
-            # the person who isn't side to move has won
-            return (0 if side_to_move == "white" else 1), len(moves) // 2, "mate"
-
-        # otherwise there are moves to be made
-        # construct a string telling the engine to move about the current
-        # boardstate
-        engine_to_move.give_history(moves)
-        move, move_duration = engine_to_move.go_w_clock(clocks, inc)
-        clock_idx = 0 if side_to_move == "white" else 1
-
-        if clocks[clock_idx] < move_duration:
-            # timeout
-            return (0 if side_to_move == "white" else 1), len(moves) // 2, "timeout"
-
-        # update clocks
-        clocks[clock_idx] += inc - move_duration
-
-        # update board
-        try:
-            uci_move = chess.Move.from_uci(move)
-            board.push(uci_move)
-            moves.append(uci_move)
-        except Exception:
-            # something illegal?
-            return (0 if side_to_move == "white" else 1), len(moves) // 2, "illegal move"
-
-        if side_to_move == "white":
-            side_to_move = "black"
-            engine_to_move = engines[1]
-        else:
-            side_to_move = "white"
-            engine_to_move = engines[0]
-
-
-def parse_puzzle(epd):
-    # TODO: more robust
-    # current assumption is:
-    # fen but only the first four
-
-    # this is going to be a lot of trial and error
-    # based on just seeing epds that come in
-    puzzle_info = {}
-
-    tokens = epd.strip().split()
-    partial_fen, rest = ' '.join(tokens[:4]), ' '.join(tokens[4:])
-
-    fen = f"{partial_fen} 0 1"  # half-clock, etc. shouldn't matter
-    puzzle_info["fen"] = fen
-
-    board = chess.Board(fen)
-
-    if rest[0] == '-':
-        rest = rest[2:]
-    other_info = map(lambda x: x.strip(), rest.split(';'))
-
-    # TEMP do some sort of recursive descent thing if needed?  For now we're going to make assumptions.
-    for info in other_info:
-        if not info:
-            continue
-        tokens = info.split()
-        key, value = tokens[0], tokens[1:]
-        # print("OTHER", key, value)
-        if key == 'am':
-            puzzle_info['avoid_move'] = set([str(board.parse_san(v)) for v in re.split('[ ,]+', ' '.join(value))])
-        elif key == 'bm':
-            puzzle_info['best_move'] = set([str(board.parse_san(v)) for v in re.split(r'[ ,]+', ' '.join(value))])
-        elif key == 'id':
-            puzzle_info['id'] = ' '.join(value)
-        else:
-            puzzle_info[key] = ' '.join(value)
-
-    return puzzle_info
-
-
-def do_one_puzzle(engine, puzzle_epd, movetime):
-    puzzle_info = parse_puzzle(puzzle_epd)
+def do_one_puzzle(engine, puzzle_info, movetime):
     print(f"{engine.name} doing puzzle {puzzle_info.get('id', 'unknown')}")
     print(f"fen: {puzzle_info['fen']}")
     print(f"best moves: {puzzle_info.get('best_move', 'N/a')}")
     print(f"avoid moves: {puzzle_info.get('avoid_move', 'N/a')}")
+    if 'move_scores' in puzzle_info:
+        print(f"move scores: {puzzle_info['move_scores']}")
 
-    engine.give_fen(puzzle_info['fen'])
-    move, _ = engine.go_w_movetime(movetime)
+    mark = engine.resource_mark()
+    try:
+        engine.give_fen(puzzle_info['fen'])
+        move, duration = engine.go_w_movetime(movetime)
+    except (EngineError, BrokenPipeError):
+        # engine died or was killed over its resource limits, which scores
+        # zero.  bring it back for the next puzzle
+        print(f"{engine.name} exited ({engine.kill_reason or 'crash'}), puzzle forfeited")
+        _, max_points = score_move(puzzle_info, None)
+        try:
+            engine.restart()
+        except (EngineError, BrokenPipeError):
+            # the next puzzle tries again, and forfeits too if it can't
+            print(f"{engine.name} exited during restart ({engine.kill_reason or 'crash'})")
+        return puzzle_info.get('id', 'unknown'), 0, max_points, movetime, engine.resource_summary(mark)
 
-    success = True
-    if 'best_move' in puzzle_info:
-        success = success and move in puzzle_info['best_move']
-    if 'avoid_move' in puzzle_info:
-        success = success and move not in puzzle_info['avoid_move']
+    points, max_points = score_move(puzzle_info, move)
 
     print(f"{engine.name} chose move {move} with depth {engine.info.get('depth', 'N/a')}")
-    if success:
+    if points == max_points:
         print("Passed!")
+    elif points > 0:
+        print(f"Partial credit: {points} / {max_points}")
     else:
         print("Failed...")
 
-    return puzzle_info.get('id', 'unknown'), success
+    return puzzle_info.get('id', 'unknown'), points, max_points, duration, engine.resource_summary(mark)
 
 
-def do_puzzle_suite(engine_fname, puzzle_file, movetime, settings={}):
-    engine = Engine(engine_fname, settings)
-    with open(puzzle_file) as f:
-        puzzles = [l.strip() for l in f.read().split('\n') if l.strip()]
-        results = []
-        for puzzle_epd in puzzles:
-            results.append(do_one_puzzle(engine, puzzle_epd, movetime))
+def do_puzzle_suite(engine_fname, puzzle_file, movetime, settings={}, cache_dir=None):
+    engine = take_engine(engine_fname, settings)
+    puzzles = load_puzzles(puzzle_file, cache_dir)
+    results = []
+    themes = {}
+    for puzzle_info in puzzles:
+        result = do_one_puzzle(engine, puzzle_info, movetime)
+        results.append(result)
+
+        theme = themes.setdefault(puzzle_theme(puzzle_info), [0, 0, 0])
+        theme[0] += result[1]
+        theme[1] += result[2]
+        theme[2] += 1
 
     score = sum(map(lambda x: x[1], results))
-    return score, len(results)
+    total = sum(map(lambda x: x[2], results))
+    search_seconds = sum(map(lambda x: x[3], results)) / 1000.
+
+    if len(themes) > 1:
+        print("Theme subtotals:")
+        for theme, (theme_score, theme_total, count) in themes.items():
+            pct = 100. * theme_score / theme_total if theme_total else 0.
+            print(f"  {theme:<32} {theme_score:>6} / {theme_total:<6} ({pct:.1f}%, {count} positions)")
+
+    summary = engine.resource_summary()
+    if summary:
+        print(f"{engine.name} resources: {format_summary(summary)}")
+
+    if total:
+        print(f"Aggregate: {100. * score / total:.1f}% of available points")
+    if search_seconds > 0:
+        # lets runs at different movetimes be put side by side
+        print(f"Time normalized: {score / search_seconds:.2f} points per search second")
+
+    return score, total
 
 
 def run_puzzle_gauntlet(settings):
@@ -181,19 +128,84 @@ def run_puzzle_gauntlet(settings):
     puzzle_file = settings.puzzle_suite
     movetime = settings.puzzle_movetime
     engine_settings = settings.engine_settings
+    cache_dir = settings.cache_dir
 
     print("Starting puzzle gauntlet")
     print(f"Puzzle file: {os.path.basename(puzzle_file)}")
     print(f"Time per Move: {movetime} ms")
-    score, total = do_puzzle_suite(hero, puzzle_file, movetime, engine_settings)
+    score, total = do_puzzle_suite(hero, puzzle_file, movetime, engine_settings, cache_dir=cache_dir)
     print(f"total score: {score} / {total}")
 
     return score, total
 
 
-def engine_battle(e1_fname, e2_fname, book, clock, inc, max_book_ply=10, settings={}):
+def print_game_resources(engines, marks):
+    summaries = []
+    for engine, mark in zip(engines, marks):
+        summary = engine.resource_summary(mark) if engine is not None else None
+        summaries.append(summary)
+        if summary:
+            print(f"  {engine.name}: {format_summary(summary)}")
+    return summaries
+
+
+def print_peak_resources(games):
+    # the worst game for each engine, handy for setting --engine-max-* limits
+    peaks = {}
+    for game in games:
+        for side in ("white", "black"):
+            summary = game["resources"][side]
+            if summary:
+                peak = peaks.setdefault(game[side], [0., 0])
+                peak[0] = max(peak[0], summary["peak_rss_mb"])
+                peak[1] = max(peak[1], summary["max_threads"])
+    if peaks:
+        print("Peak resources over all games:")
+        for name, (rss, threads) in peaks.items():
+            print(f"  {name}: rss {rss} MB, threads {threads}")
+
+
+def _take_battle_engine(fname, settings, cpus):
+    # None if the engine exits or is killed before it's ready, which
+    # forfeits its games
+    try:
+        return take_engine(fname, settings, cpus=cpus)
+    except (EngineError, BrokenPipeError) as e:
+        print(f"Couldn't start {fname}: {e}")
+        return None
+
+
+def _restart_battle_engine(engine):
+    if engine is None:
+        return None
+    try:
+        engine.restart()
+        return engine
+    except (EngineError, BrokenPipeError):
+        print(f"{engine.name} exited during restart ({engine.kill_reason or 'crash'})")
+        return None
+
+
+def _battle_game(white, black, clock, inc, starting_moves, store, metrics):
+    # a side that isn't running loses without a move being played
+    if white is None and black is None:
+        return 0.5, 0, "neither engine running"
+    if white is None or black is None:
+        return (0 if white is None else 1), 0, "forfeit, engine not running"
+    return run_game(white, black, clock, inc, starting_moves, store=store, metrics=metrics)
+
+
+def _resource_marks(engines):
+    return tuple(engine.resource_mark() if engine is not None else 0 for engine in engines)
+
+
+def engine_battle(e1_fname, e2_fname, book, clock, inc, max_book_ply=10, settings={}, store=None, slot=None,
+                  metrics=None):
     # settings should be only read so the default is fine here
+    # with a `slot`, both engines are pinned to its cores and get their
+    # Threads and Hash defaults from it
     record = [0, 0, 0]          # from e1's perspective, win draw loss
+    games = []                  # result and resource usage of each game
     game_winners = 0
 
     # just in case an engine does not support FEN, the starting positions
@@ -211,47 +223,66 @@ def engine_battle(e1_fname, e2_fname, book, clock, inc, max_book_ply=10, setting
             except IndexError:
                 break
 
-    e1 = Engine(e1_fname, settings)
-    e2 = Engine(e2_fname, settings)
+    cpus = None
+    if slot is not None:
+        settings = slot.options(settings)
+        cpus = slot.affinity()
+    e1 = _take_battle_engine(e1_fname, settings, cpus)
+    e2 = _take_battle_engine(e2_fname, settings, cpus)
+    name1 = e1.name if e1 is not None else os.path.basename(e1_fname)
+    name2 = e2.name if e2 is not None else os.path.basename(e2_fname)
 
-    print(f"Beginning Match: {e1.name} vs. {e2.name}")
+    print(f"Beginning Match: {name1} vs. {name2}")
     print(f"Starting position is: {board.fen()}")
     print(f"Starting Clock: {clock}, inc: {inc}")
     print()
 
     # engine 1 as white
-    winner, move_count, reason = run_game(e1, e2, clock, inc, starting_moves)
+    marks = _resource_marks((e1, e2))
+    winner, move_count, reason = _battle_game(e1, e2, clock, inc, starting_moves, store, metrics)
     # if e1 wins here, `winner` is going to be 1, loss is 0
     record_idx = int(2 - (winner * 2))
     record[record_idx] += 1
+    if metrics is not None:
+        metrics.record_game(winner, reason)
 
     print("Game 1 complete")
     if winner == 0.5:
         print(f"Draw for reason: {reason}")
     else:
-        print(f"Win by {e1.name if winner else e2.name} via: {reason}")
+        print(f"Win by {name1 if winner else name2} via: {reason}")
+    summaries = print_game_resources((e1, e2), marks)
+    games.append({"white": name1, "black": name2, "result": winner, "reason": reason,
+                  "resources": {"white": summaries[0], "black": summaries[1]}})
     print()
 
-    e1.restart()
-    e2.restart()
+    e1 = _restart_battle_engine(e1)
+    e2 = _restart_battle_engine(e2)
 
     # engine 1 as black
-    winner, move_count, reason = run_game(e2, e1, clock, inc, starting_moves)
+    marks = _resource_marks((e1, e2))
+    winner, move_count, reason = _battle_game(e2, e1, clock, inc, starting_moves, store, metrics)
     # if e1 wins here, `winner` is going to be 0, loss is 1
     record_idx = int(winner * 2)
     record[record_idx] += 1
+    if metrics is not None:
+        metrics.record_game(1 - winner, reason)
 
     print("Game 2 complete")
     if winner == 0.5:
         print(f"Draw for reason: {reason}")
     else:
-        print(f"Win by {e2.name if winner else e1.name} via: {reason}")
+        print(f"Win by {name2 if winner else name1} via: {reason}")
+    summaries = print_game_resources((e1, e2), marks)
+    games.append({"white": name2, "black": name1, "result": winner, "reason": reason,
+                  "resources": {"white": summaries[1], "black": summaries[0]}})
     print()
 
     print(f"Match concluded.  Record is {'-'.join(map(str, record))}")
+    print_game_resources((e1, e2), (0, 0))
     print()
 
-    return record
+    return record, games
 
 
 def run_engine_gauntlet(settings):
@@ -263,20 +294,31 @@ def run_engine_gauntlet(settings):
     inc = settings.clock_inc
     max_book_ply = settings.opening_book_ply
     engine_settings = settings.engine_settings
+    store = settings.game_store
+    metrics = settings.metrics
+    slots = allocate_slots(settings.concurrency, memory_budget_mb=settings.memory_budget_mb, pin=settings.pin_cpus)
 
-    for challenger in challengers:
-        record = engine_battle(
+    def battle(challenger):
+        return lambda slot: engine_battle(
             hero,
             challenger,
             book,
             clock_time,
             inc,
             max_book_ply=max_book_ply,
-            settings=engine_settings)
-
+            settings=engine_settings,
+            store=store,
+            slot=slot,
+            metrics=metrics)
+
+    all_games = []
+    for record, games in run_in_slots([battle(challenger) for challenger in challengers], slots):
+        all_games += games
         for i in range(len(record)):
             overall_record[i] += record[i]
 
+    print_peak_resources(all_games)
+
     print("Guantlet Concluded.  Overall record: {'-'.join(map(str, overall_record))}")
     return overall_record
 
@@ -290,33 +332,44 @@ def compare_engine_elo(settings):
     max_book_ply = settings.opening_book_ply
     engine_settings = settings.engine_settings
     num_rounds = settings.elo_rounds
+    store = settings.game_store
+    metrics = settings.metrics
+    slots = allocate_slots(settings.concurrency, memory_budget_mb=settings.memory_budget_mb, pin=settings.pin_cpus)
 
     elo1, elo2 = 1000, 1000
 
-    overall_record = [0, 0, 0]
-    for r in range(num_rounds):
-        record = engine_battle(
+    def battle(slot):
+        return engine_battle(
             hero,
             rival,
             book,
             clock_time,
             inc,
             max_book_ply=max_book_ply,
-            settings=engine_settings)
+            settings=engine_settings,
+            store=store,
+            slot=slot,
+            metrics=metrics)
 
+    overall_record = [0, 0, 0]
+    all_games = []
+    # rounds finish in whatever order the slots get through them
+    for r, (record, games) in enumerate(run_in_slots([battle] * num_rounds, slots)):
+        all_games += games
         for i in range(len(record)):
             overall_record[i] += record[i]
 
             # update ELO.  remember the 0th index
             # of record refers to a win by our hero.
             result = 1 - (i / 2)
-            for i in range(record[i]):
+            for _ in range(record[i]):
                 elo1, elo2 = get_new_elo(elo1, elo2, result)
 
         print(f"Rounds passed: {r + 1}")
         print(f"Relative Elo: {int(elo1)} - {int(elo2)}")
         print()
 
+    print_peak_resources(all_games)
     return elo1, elo2
 
 
@@ -329,23 +382,68 @@ def main():
         print(f"Settings malformed: {err}")
         sys.exit(1)
 
+    if settings.preflight and not run_preflight(settings):
+        print("Preflight failed, fix the engines above before running")
+        sys.exit(1)
+
+    if settings.calibrate:
+        calibrate(settings)
+
+    if settings.metrics is not None:
+        settings.metrics.start()
+    if settings.monitor_interval:
+        start_monitor(settings.monitor_interval, settings.engine_max_rss_mb, settings.engine_max_threads)
+
     record = None
     puzzle_score, puzzle_total = None, None
 
+    if settings.build_book:
+        book_positions, book_entries = run_build_book(settings)
     if settings.run_games:
         record = run_engine_gauntlet(settings)
     if settings.run_puzzles:
         puzzle_score, puzzle_total = run_puzzle_gauntlet(settings)
     if settings.compare_elo:
         elo1, elo2 = compare_engine_elo(settings)
+    if settings.analyze:
+        analysis_topk, analysis_total = run_analysis(settings)
+    if settings.selfplay:
+        selfplay_games, selfplay_positions = run_selfplay(settings)
+    if settings.bench:
+        bench_results = run_bench(settings)
+    if settings.perft:
+        perft_passed, perft_total = run_perft(settings)
+    if settings.harness_bench:
+        harness_results = run_harness_bench(settings)
+    if settings.annotate:
+        annotate_games, annotate_positions = run_annotate(settings)
+
+    if settings.metrics is not None:
+        settings.metrics.stop()
 
     print("Tests complete.  Overall results:")
+    if settings.build_book:
+        print(f"Opening book: {book_entries} moves for {book_positions} positions")
     if settings.run_games:
         print(f"Engine Guantlet Record: {'-'.join(map(str, record))}")
     if settings.run_puzzles:
         print(f"Puzzle Gauntlet Score: {puzzle_score} / {puzzle_total}")
     if settings.compare_elo:
         print(f"Engine Comparison Elo results: {elo1} - {elo2}")
+    if settings.analyze:
+        print(f"Analysis bm in top {settings.analysis_multipv}: {analysis_topk} / {analysis_total}")
+    if settings.selfplay:
+        print(f"Self-play: {selfplay_games} games, {selfplay_positions} positions")
+    if settings.bench:
+        best = max(bench_results["configs"], key=lambda x: x["summary"]["nps"])
+        print(f"Bench peak: {best['summary']['nps']} nps at {best['threads']} threads, {best['hash']} MB hash")
+    if settings.perft:
+        print(f"Perft: {perft_passed} / {perft_total} positions correct")
+    if settings.harness_bench:
+        print(f"Harness: {harness_results['games']['plies_per_sec']:.0f} plies/sec, "
+              f"{harness_results['info_lines']['lines_per_sec']:.0f} info lines/sec")
+    if settings.annotate:
+        print(f"Annotation: {annotate_games} games, {annotate_positions} positions")
 
 
 if __name__ == "__main__":
@@ -1,23 +1,130 @@
+import collections
 import os
 import subprocess
+import threading
 import time
 
+import monitor
+
 SUBPROCS = {}
 
+# bytes per read from an engine's stdout
+READ_SIZE = 1 << 16
+
+
+class PipeReader:
+    # drains an engine's stdout on its own thread with large reads, so the
+    # engine never blocks on a full pipe and we split lines in batches
+    def __init__(self, pipe):
+        self.fd = pipe.fileno()
+        self.lines = collections.deque()
+        self.cond = threading.Condition()
+        self.eof = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        tail = b""
+        while True:
+            try:
+                chunk = os.read(self.fd, READ_SIZE)
+            except OSError:
+                chunk = b""
+            if not chunk:
+                with self.cond:
+                    if tail:
+                        self.lines.append(tail)
+                    self.eof = True
+                    self.cond.notify_all()
+                return
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            if lines:
+                with self.cond:
+                    self.lines.extend(lines)
+                    self.cond.notify_all()
+
+    def read_batch(self):
+        # every complete line read so far, waiting for at least one
+        with self.cond:
+            while not self.lines and not self.eof:
+                self.cond.wait()
+            batch = list(self.lines)
+            self.lines.clear()
+            return batch
+
+    def unread(self, lines):
+        with self.cond:
+            self.lines.extendleft(reversed(lines))
+
+    def readline(self, timeout=None):
+        # b"" at eof, or once `timeout` seconds pass without a line
+        with self.cond:
+            self.cond.wait_for(lambda: self.lines or self.eof, timeout)
+            return self.lines.popleft() if self.lines else b""
+
+
+def _info_field(line, field):
+    # pull one value out of a raw info line without tokenizing all of it
+    idx = line.find(field)
+    if idx < 0:
+        return None
+    start = idx + len(field)
+    end = line.find(b" ", start)
+    return line[start:end] if end >= 0 else line[start:]
+
+
+# keywords of an advertised option line, everything between two of them is
+# that field's value (names and string defaults can contain spaces)
+OPTION_FIELDS = ("name", "type", "default", "min", "max", "var")
+
+
+def _parse_option(tokens):
+    spec = {"var": []}
+    field, words = None, []
+    for token in tokens + [None]:
+        if token is None or token in OPTION_FIELDS:
+            if field == "var":
+                spec["var"].append(' '.join(words))
+            elif field is not None:
+                spec[field] = ' '.join(words)
+            field, words = token, []
+        else:
+            words.append(token)
+    return spec
+
+
+class EngineError(Exception):
+    pass
+
+
 class Engine:
-    def __init__(self, fname, settings={}):
+    def __init__(self, fname, settings={}, cpus=None):
         self.path = fname
-        self.e = subprocess.Popen([self.path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.cpus = cpus
+        self.e = self._spawn()
         self.pid = self.e.pid
+        self.reader = PipeReader(self.e.stdout)
+        self._pin()
         self.settings = settings
         self.info = {}
+        self.multipv = {}
+        self.multipv_depths = {}
+        self.search_stats = {}
+        self.search_start = None
         self.name = None
         self.full_name = None
         self.printer = None
+        self.resource_samples = []
+        self.kill_reason = None
+        self.options = {}
+        self.handshake_ms = None
 
         # we use this to clean up any lingering subprocs
         # just to be safe and not leak engines
         SUBPROCS[self.pid] = self.e
+        if monitor.MONITOR is not None:
+            monitor.MONITOR.register(self)
 
         self.uci()
         if self.name is None:
@@ -27,21 +134,49 @@ class Engine:
             self.full_name = self.name
         self.load_settings()
 
+    def _spawn(self):
+        return subprocess.Popen([self.path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def _pin(self):
+        # any search threads the engine starts later inherit this
+        if self.cpus and self.pid > 0 and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(self.pid, self.cpus)
+
     def restart(self):
         # completely fresh restart, aka kill the process
         self.e.terminate()
         del SUBPROCS[self.pid]
 
-        self.e = subprocess.Popen([self.path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.e = self._spawn()
         self.pid = self.e.pid
+        self.reader = PipeReader(self.e.stdout)
+        self._pin()
         SUBPROCS[self.pid] = self.e
+        self.kill_reason = None
 
         self.uci()
         self.load_settings()
 
     def load_settings(self):
         for param, value in self.settings.items():
-            self.send_uci(f"setoption {param} {value}")
+            self.set_option(param, value)
+        # options like Hash allocate when set, make sure that's done before
+        # the first search starts anybody's clock
+        self.is_ready()
+
+    def reconfigure(self, settings, cpus=None):
+        # reuse a running engine with new options and cores instead of
+        # paying for another process and handshake
+        for param, value in settings.items():
+            if self.settings.get(param) != value:
+                self.set_option(param, value)
+        self.settings = settings
+        self.cpus = cpus
+        self._pin()
+        self.is_ready()
+
+    def set_option(self, name, value):
+        self.send_uci(f"setoption name {name} value {value}")
 
     def send_uci(self, uci):
         self.e.stdin.write(bytes(f"{uci}\n", "utf-8"))
@@ -96,27 +231,114 @@ class Engine:
                 self.info["score"], idx = self._load_score(info_tokens, idx + 1)
             elif token == "currmove":
                 self.info["currmove"], idx = self._load_generic(info_tokens, idx + 1)
-            elif token == "depth":
-                self.info["depth"], idx = self._load_generic(info_tokens, idx + 1)
+            elif token in ("depth", "seldepth", "multipv", "nodes", "nps", "time"):
+                self.info[token], idx = self._load_generic(info_tokens, idx + 1)
+            elif token == "string":
+                # the rest of the line is free text
+                break
             else:
                 # TODO other token types
                 idx += 1
+        if self.info.get("pv"):
+            # keep the latest line for each multipv slot at each depth so a
+            # single search can report more than just the best move
+            depth = int(self.info.get("depth", 0))
+            self.multipv_depths.setdefault(depth, {})[int(self.info.get("multipv", 1))] = self.info
+            self.multipv = self._select_multipv()
+        self._update_search_stats()
         if self.printer is not None and self.info.get("pv") is not None and self.info["pv"]:
             self.printer.info_update(self.info["pv"][0])
 
+    def _select_multipv(self):
+        # engines can send slot 1 at a new depth before re-sending the other
+        # slots, so use the deepest depth that has a line for every slot
+        slots = set()
+        for lines in self.multipv_depths.values():
+            slots.update(lines)
+        lines = None
+        for depth in sorted(self.multipv_depths, reverse=True):
+            if slots <= set(self.multipv_depths[depth]):
+                lines = self.multipv_depths[depth]
+                break
+        if lines is None:
+            lines = {}
+            for depth in sorted(self.multipv_depths):
+                lines.update(self.multipv_depths[depth])
+
+        # and never list the same move twice
+        selected, seen = {}, set()
+        for slot in sorted(lines):
+            move = lines[slot]["pv"][0]
+            if move not in seen:
+                seen.add(move)
+                selected[slot] = lines[slot]
+        return selected
+
+    def _update_search_stats(self):
+        # running totals for the current search, these survive info lines
+        # that don't repeat every field
+        for key in ("nodes", "nps", "time"):
+            if key in self.info:
+                self.search_stats[key] = int(self.info[key])
+        if "depth" in self.info:
+            depth = int(self.info["depth"])
+            self.search_stats["depth"] = max(depth, self.search_stats.get("depth", 0))
+
     def _readline(self):
-        return self.e.stdout.readline().decode("utf-8")[:-1].strip().split()
+        line = self.reader.readline()
+        if not line and self.reader.eof:
+            raise EngineError(f"{self.name or self.path} exited ({self.kill_reason or 'crash'})")
+        return line.decode("utf-8").strip().split()
 
     def _recv_move(self):
+        self.multipv = {}
+        self.multipv_depths = {}
+        self.search_start = time.time()
+        # filled in as lines arrive rather than when they're parsed.  a depth
+        # is reached when its first exact pv line shows up; currmove chatter
+        # at that depth only means it has started
+        depth_times = {}
+        self.search_stats = {"depth_times": depth_times}
+
+        # info lines can arrive by the thousand, so only the ones somebody
+        # reads are parsed: the latest pv line for each depth (and multipv
+        # slot), and whatever info line came last before bestmove
+        pv_lines = {}
+        last_info = None
+        seen_depths = set()
         while True:
-            resp = self._readline()
-            if not resp: continue
-            if resp[0] == "info":
-                self.load_info(resp[1:])
-            elif resp[0] == "bestmove":
-                return resp[1]
-            else:
-                continue
+            batch = self.reader.read_batch()
+            if not batch and self.reader.eof:
+                raise EngineError(f"{self.name} exited mid search ({self.kill_reason or 'crash'})")
+            for i, line in enumerate(batch):
+                line = line.strip()
+                if line.startswith(b"info"):
+                    last_info = line
+                    if b" pv " in line:
+                        depth = _info_field(line, b" depth ")
+                        if depth is not None and depth not in seen_depths \
+                                and b"lowerbound" not in line and b"upperbound" not in line:
+                            seen_depths.add(depth)
+                            elapsed = _info_field(line, b" time ")
+                            try:
+                                if elapsed is not None:
+                                    depth_times[int(depth)] = int(elapsed)
+                                else:
+                                    depth_times[int(depth)] = int((time.time() - self.search_start) * 1000)
+                            except ValueError:
+                                pass
+                        key = (depth, _info_field(line, b" multipv "))
+                        # re-inserting keeps pv_lines in arrival order
+                        pv_lines.pop(key, None)
+                        pv_lines[key] = line
+                elif line.startswith(b"bestmove"):
+                    self.reader.unread(batch[i + 1:])
+                    for pv_line in pv_lines.values():
+                        if pv_line is not last_info:
+                            self.load_info(pv_line.decode("utf-8").split()[1:])
+                    if last_info is not None:
+                        self.load_info(last_info.decode("utf-8").split()[1:])
+                    return line.decode("utf-8").split()[1]
 
     def go_w_clock(self, clocks, inc):
         wtime, btime = clocks
@@ -136,6 +358,32 @@ class Engine:
         duration = int((time.time() - start_time) * 1000)
         return move, duration
 
+    def go_w_nodes(self, nodes):
+        cmd = f"go nodes {nodes}"
+        start_time = time.time()
+        self.send_uci(cmd)
+        move = self._recv_move()
+        duration = int((time.time() - start_time) * 1000)
+        return move, duration
+
+    def go_w_depth(self, depth):
+        cmd = f"go depth {depth}"
+        start_time = time.time()
+        self.send_uci(cmd)
+        move = self._recv_move()
+        duration = int((time.time() - start_time) * 1000)
+        return move, duration
+
+    def is_ready(self):
+        self.send_uci("isready")
+        while True:
+            resp = self._readline()
+            if resp and resp[0] == "readyok":
+                return
+
+    def new_game(self):
+        self.send_uci("ucinewgame")
+
     def go(self):
         cmd = f"go"
         self.send_uci(cmd)
@@ -143,6 +391,7 @@ class Engine:
 
     def uci(self):
         cmd = "uci"
+        start_time = time.time()
         self.send_uci(cmd)
         while True:
             resp = self._readline()
@@ -151,9 +400,21 @@ class Engine:
             if resp[:2] == ["id", "name"]:
                 self.name = resp[2]
                 self.full_name = '_'.join(resp[2:])
+            if resp[0] == "option":
+                # uci option names are case insensitive
+                spec = _parse_option(resp[1:])
+                self.options[spec.get("name", "").lower()] = spec
             if resp[0] == "uciok":
+                self.handshake_ms = int((time.time() - start_time) * 1000)
                 return
 
+    def resource_mark(self):
+        return len(self.resource_samples)
+
+    def resource_summary(self, mark=0):
+        # process usage sampled since `mark`
+        return monitor.summarize(self.resource_samples[mark:])
+
     def set_printer(self, printer):
         self.printer = printer
 
@@ -163,6 +424,19 @@ class Engine:
             del SUBPROCS[self.pid]
 
 
+def score_to_cp(score, mate_value=32000):
+    # collapse a parsed uci score into centipawns from the side to move's
+    # point of view, with mates pushed out past any real evaluation
+    if score is None:
+        return None
+    value = int(score["value"])
+    if score["type"] == "mate":
+        if value > 0:
+            return mate_value - value
+        return -mate_value - value
+    return value
+
+
 def kill_all_engines():
     for proc in SUBPROCS.values():
         proc.kill()
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import pickle
+import re
+
+import chess
+
+# bump this whenever the shape of parsed puzzle info changes so stale
+# caches are thrown away instead of being trusted
+CACHE_VERSION = 1
+
+
+def _parse_san_list(board, value):
+    return set([str(board.parse_san(v)) for v in re.split(r'[ ,]+', ' '.join(value)) if v])
+
+
+def _parse_move_scores(board, value):
+    # STS style c0 opcode, e.g. c0 "Nf3=10, Qd2=3, h3=1"
+    move_scores = {}
+    text = ' '.join(value).strip('"')
+    for entry in text.split(','):
+        entry = entry.strip()
+        if '=' not in entry:
+            continue
+        san, points = entry.rsplit('=', 1)
+        move_scores[str(board.parse_san(san.strip()))] = int(points)
+    return move_scores
+
+
+def parse_puzzle(epd):
+    # TODO: more robust
+    # current assumption is:
+    # fen but only the first four
+
+    # this is going to be a lot of trial and error
+    # based on just seeing epds that come in
+    puzzle_info = {}
+
+    tokens = epd.strip().split()
+    partial_fen, rest = ' '.join(tokens[:4]), ' '.join(tokens[4:])
+
+    fen = f"{partial_fen} 0 1"  # half-clock, etc. shouldn't matter
+    puzzle_info["fen"] = fen
+
+    board = chess.Board(fen)
+
+    if rest[0] == '-':
+        rest = rest[2:]
+    other_info = map(lambda x: x.strip(), rest.split(';'))
+
+    # TEMP do some sort of recursive descent thing if needed?  For now we're going to make assumptions.
+    for info in other_info:
+        if not info:
+            continue
+        tokens = info.split()
+        key, value = tokens[0], tokens[1:]
+        # print("OTHER", key, value)
+        if key == 'am':
+            puzzle_info['avoid_move'] = _parse_san_list(board, value)
+        elif key == 'bm':
+            puzzle_info['best_move'] = _parse_san_list(board, value)
+        elif key == 'id':
+            puzzle_info['id'] = ' '.join(value).strip('"')
+        elif key == 'c0' and '=' in info:
+            puzzle_info['move_scores'] = _parse_move_scores(board, value)
+        else:
+            puzzle_info[key] = ' '.join(value).strip('"')
+
+    # some suites give the weights as parallel c7 (moves) and c8 (points) lists
+    if 'move_scores' not in puzzle_info and 'c7' in puzzle_info and 'c8' in puzzle_info:
+        moves = puzzle_info['c7'].split()
+        points = puzzle_info['c8'].split()
+        if len(moves) == len(points):
+            puzzle_info['move_scores'] = {str(board.parse_san(m)): int(p) for m, p in zip(moves, points)}
+
+    return puzzle_info
+
+
+def puzzle_theme(puzzle_info):
+    # ids tend to look like "BK.01" or "STS(v1.0) Undermine.001",
+    # so the theme is whatever is in front of the numbering
+    puzzle_id = puzzle_info.get('id', 'unknown')
+    theme = puzzle_id.rsplit('.', 1)[0] if '.' in puzzle_id else puzzle_id
+    theme = re.sub(r'^\S*\)\s*', '', theme)
+    return theme or 'unknown'
+
+
+def score_move(puzzle_info, move):
+    # returns (points, max points) for the move an engine chose.
+    # weighted puzzles give partial credit, everything else is all or nothing
+    move_scores = puzzle_info.get('move_scores')
+    if move_scores:
+        return move_scores.get(move, 0), max(move_scores.values())
+
+    success = True
+    if 'best_move' in puzzle_info:
+        success = success and move in puzzle_info['best_move']
+    if 'avoid_move' in puzzle_info:
+        success = success and move not in puzzle_info['avoid_move']
+    return (1 if success else 0), 1
+
+
+def _cache_fname(puzzle_file, cache_dir):
+    key = hashlib.sha1(os.path.abspath(puzzle_file).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"epd_{key}.pkl")
+
+
+def load_puzzles(puzzle_file, cache_dir=None):
+    # parsing (and especially SAN resolution) dominates for large suites,
+    # so keep the parsed result around keyed on the file's size and mtime
+    stat = os.stat(puzzle_file)
+    stamp = (CACHE_VERSION, stat.st_size, stat.st_mtime_ns)
+
+    cache_fname = None
+    if cache_dir is not None:
+        cache_fname = _cache_fname(puzzle_file, cache_dir)
+        if os.path.isfile(cache_fname):
+            try:
+                with open(cache_fname, "rb") as f:
+                    cached_stamp, puzzles = pickle.load(f)
+                if cached_stamp == stamp:
+                    return puzzles
+            except Exception:
+                # a corrupt cache is just a cache miss
+                pass
+
+    with open(puzzle_file) as f:
+        puzzles = [parse_puzzle(l) for l in f.read().split('\n') if l.strip()]
+
+    if cache_fname is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_fname = f"{cache_fname}.tmp"
+        with open(tmp_fname, "wb") as f:
+            pickle.dump((stamp, puzzles), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, cache_fname)
+
+    return puzzles
@@ -0,0 +1,170 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+
+import chess
+
+# moves are packed into 16 bits: from square, to square and promotion
+#   bits 0-5 from, bits 6-11 to, bits 12-14 promotion piece type (0 for none)
+PROMOTION_BITS = 12
+
+# the file is a sequence of records, each starting on an even offset so
+# the move codes can be viewed in place as uint16 through an mmap:
+#   name record  'N', pad, u16 length, utf-8 bytes (padded to even)
+#   game record  'G', u8 result, u16 white, u16 black, u16 reason,
+#                u16 book plies, u16 move count, move codes
+#   resources    'R', pad, u16 length, utf-8 json (padded to even), the
+#                engines' resource summaries for the game before it
+# names and reasons are indices into the table built from name records
+NAME_HEADER = struct.Struct("<cxH")
+GAME_HEADER = struct.Struct("<cBHHHHH")
+RESOURCE_HEADER = struct.Struct("<cxH")
+
+
+def encode_move(move):
+    code = move.from_square | (move.to_square << 6)
+    if move.promotion:
+        code |= move.promotion << PROMOTION_BITS
+    return code
+
+
+def decode_move(code):
+    promotion = code >> PROMOTION_BITS
+    return chess.Move(code & 0x3f, (code >> 6) & 0x3f, promotion=promotion or None)
+
+
+class GameHeader:
+    __slots__ = ("white", "black", "result", "reason", "book_plies", "start", "length", "resources")
+
+    def __init__(self, white, black, result, reason, book_plies, start, length, resources=None):
+        self.white = white              # name table index
+        self.black = black              # name table index
+        self.result = result            # 2 white win, 1 draw, 0 black win
+        self.reason = reason            # name table index
+        self.book_plies = book_plies
+        self.start = start              # offset into the move array
+        self.length = length
+        self.resources = resources      # {"white": summary, "black": summary}
+
+
+class GameStore:
+    def __init__(self, fname=None):
+        self.moves = array('H')
+        self.headers = []
+        self.names = []
+        self._name_idx = {}
+        self.fname = fname
+        self._file = None
+        # concurrent games all record into the same store
+        self._lock = threading.Lock()
+
+        if fname is not None:
+            if os.path.isfile(fname) and os.path.getsize(fname) > 0:
+                self._load(fname)
+            self._file = open(fname, "ab")
+
+    def _load(self, fname):
+        with open(fname, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                offset = 0
+                while offset < len(data):
+                    tag = data[offset:offset + 1]
+                    if tag == b'N':
+                        (_, length) = NAME_HEADER.unpack_from(data, offset)
+                        offset += NAME_HEADER.size
+                        self._add_name(data[offset:offset + length].decode("utf-8"))
+                        offset += length + (length & 1)
+                    elif tag == b'G':
+                        _, result, white, black, reason, book_plies, length = GAME_HEADER.unpack_from(data, offset)
+                        offset += GAME_HEADER.size
+                        start = len(self.moves)
+                        self.moves.frombytes(data[offset:offset + 2 * length])
+                        self.headers.append(GameHeader(white, black, result, reason, book_plies, start, length))
+                        offset += 2 * length
+                    elif tag == b'R':
+                        (_, length) = RESOURCE_HEADER.unpack_from(data, offset)
+                        offset += RESOURCE_HEADER.size
+                        self.headers[-1].resources = json.loads(data[offset:offset + length].decode("utf-8"))
+                        offset += length + (length & 1)
+                    else:
+                        raise ValueError(f"{fname} is corrupt at byte {offset}")
+
+    def _add_name(self, name):
+        idx = len(self.names)
+        self.names.append(name)
+        self._name_idx[name] = idx
+        return idx
+
+    def _intern(self, name):
+        idx = self._name_idx.get(name)
+        if idx is None:
+            idx = self._add_name(name)
+            if self._file is not None:
+                encoded = name.encode("utf-8")
+                self._file.write(NAME_HEADER.pack(b'N', len(encoded)) + encoded + b'\0' * (len(encoded) & 1))
+        return idx
+
+    def add_game(self, moves, white, black, winner, reason, book_plies=0, resources=None):
+        with self._lock:
+            return self._add_game(moves, white, black, winner, reason, book_plies, resources)
+
+    def _add_game(self, moves, white, black, winner, reason, book_plies, resources):
+        codes = array('H', [encode_move(move) for move in moves])
+        header = GameHeader(
+            self._intern(white),
+            self._intern(black),
+            int(winner * 2),
+            self._intern(reason),
+            book_plies,
+            len(self.moves),
+            len(codes),
+            resources or None)
+        self.moves.extend(codes)
+        self.headers.append(header)
+
+        if self._file is not None:
+            self._file.write(GAME_HEADER.pack(
+                b'G', header.result, header.white, header.black, header.reason, book_plies, len(codes)))
+            self._file.write(codes.tobytes())
+            if header.resources is not None:
+                encoded = json.dumps(header.resources).encode("utf-8")
+                self._file.write(RESOURCE_HEADER.pack(b'R', len(encoded)) + encoded + b'\0' * (len(encoded) & 1))
+            self._file.flush()
+        return len(self.headers) - 1
+
+    def __len__(self):
+        return len(self.headers)
+
+    def move_codes(self, idx):
+        header = self.headers[idx]
+        return self.moves[header.start:header.start + header.length]
+
+    def game_moves(self, idx):
+        return [decode_move(code) for code in self.move_codes(idx)]
+
+    def game_info(self, idx):
+        header = self.headers[idx]
+        return {
+            "white": self.names[header.white],
+            "black": self.names[header.black],
+            "result": header.result / 2.,
+            "reason": self.names[header.reason],
+            "book_plies": header.book_plies,
+            "plies": header.length,
+            "resources": header.resources,
+        }
+
+    def __getitem__(self, idx):
+        return self.game_info(idx), self.game_moves(idx)
+
+    def __iter__(self):
+        for idx in range(len(self.headers)):
+            yield self[idx]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
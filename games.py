@@ -0,0 +1,133 @@
+import time
+
+import chess
+
+from board import BoardPrinter
+from engine import EngineError, score_to_cp
+
+
+def _adjudicate(scores, adjudication, ply):
+    # scores are white relative centipawns, most recent last
+    resign_plies = adjudication.get('resign_plies', 0)
+    if resign_plies and len(scores) >= resign_plies:
+        recent = scores[-resign_plies:]
+        if all(s >= adjudication['resign_score'] for s in recent):
+            return 1
+        if all(s <= -adjudication['resign_score'] for s in recent):
+            return 0
+
+    draw_plies = adjudication.get('draw_plies', 0)
+    if draw_plies and ply >= adjudication.get('draw_min_ply', 0) and len(scores) >= draw_plies:
+        if all(abs(s) <= adjudication['draw_score'] for s in scores[-draw_plies:]):
+            return 0.5
+
+    return None
+
+
+def run_game(e1, e2, clock_time, inc, starting_moves=[], nodes=None, adjudication=None, positions=None, store=None,
+             metrics=None):
+    # should return winner and num moves
+    # 1 means white wins, 0.5 means draw, 0 means black wins
+    # with `nodes` set, every search is node limited and the clocks are ignored.
+    # if `positions` is a list, (board, white relative score) is appended
+    # for every position an engine searched.
+    # finished games are added to `store` (a GameStore) if one is given,
+    # along with both engines' resource usage during the game, and per
+    # move overhead and speed are reported to `metrics`
+    moves = starting_moves[:]
+    marks = (e1.resource_mark(), e2.resource_mark())
+    winner, move_count, reason = _play_game(e1, e2, clock_time, inc, moves, nodes, adjudication, positions, metrics)
+    if store is not None:
+        resources = {"white": e1.resource_summary(marks[0]), "black": e2.resource_summary(marks[1])}
+        if not any(resources.values()):
+            resources = None
+        store.add_game(moves, e1.name, e2.name, winner, reason, book_plies=len(starting_moves),
+                       resources=resources)
+    return winner, move_count, reason
+
+
+def _play_game(e1, e2, clock_time, inc, moves, nodes, adjudication, positions, metrics):
+    board = chess.Board()
+    for move in moves:
+        board.push(move)
+
+    board_printer = BoardPrinter(active=False, initial_board=board)
+    e1.set_printer(board_printer)
+    e2.set_printer(board_printer)
+
+    engines = (e1, e2)
+
+    side_to_move = "white" if len(moves) % 2 == 0 else "black"
+    engine_to_move = engines[0] if side_to_move == "white" else engines[1]
+    # white clock, black clock
+    clocks = [clock_time, clock_time]
+    scores = []
+    while True:
+        ply_start = time.perf_counter()
+        board_printer.update(board, previous_move=str(moves[-1]) if len(moves) else None)
+        if board.is_stalemate():
+            return 0.5, len(moves) // 2, "stalemate"
+        if board.is_insufficient_material():
+            return 0.5, len(moves) // 2, "insufficient_material"
+        if board.can_claim_draw():
+            return 0.5, len(moves) // 2, "claimable draw"
+        if board.is_checkmate():
+            # the person who isn't side to move has won
+            return (0 if side_to_move == "white" else 1), len(moves) // 2, "mate"
+
+        # otherwise there are moves to be made
+        # construct a string telling the engine to move about the current
+        # boardstate
+        try:
+            engine_to_move.give_history(moves)
+            if nodes is not None:
+                move, move_duration = engine_to_move.go_w_nodes(nodes)
+            else:
+                move, move_duration = engine_to_move.go_w_clock(clocks, inc)
+        except (EngineError, BrokenPipeError):
+            # the engine died, or the resource monitor killed it.  forfeit
+            return (0 if side_to_move == "white" else 1), len(moves) // 2, engine_to_move.kill_reason or "crash"
+
+        if nodes is None:
+            clock_idx = 0 if side_to_move == "white" else 1
+
+            if clocks[clock_idx] < move_duration:
+                # timeout
+                return (0 if side_to_move == "white" else 1), len(moves) // 2, "timeout"
+
+            # update clocks
+            clocks[clock_idx] += inc - move_duration
+
+        if adjudication is not None or positions is not None:
+            score = score_to_cp(engine_to_move.info.get("score"))
+            if score is not None and side_to_move == "black":
+                score = -score
+            if positions is not None:
+                positions.append((board.copy(stack=False), score))
+            if adjudication is not None and score is not None:
+                scores.append(score)
+                winner = _adjudicate(scores, adjudication, len(moves))
+                if winner is not None:
+                    return winner, len(moves) // 2, "adjudication"
+
+        # update board
+        try:
+            uci_move = chess.Move.from_uci(move)
+            board.push(uci_move)
+            moves.append(uci_move)
+        except Exception:
+            # something illegal?
+            return (0 if side_to_move == "white" else 1), len(moves) // 2, "illegal move"
+
+        if metrics is not None:
+            # everything this ply cost that wasn't the engine searching
+            overhead_ms = (time.perf_counter() - ply_start) * 1000 - move_duration
+            stats = engine_to_move.search_stats
+            metrics.record_move(overhead_ms, stats.get("nodes"), stats.get("time", move_duration))
+
+        if side_to_move == "white":
+            side_to_move = "black"
+            engine_to_move = engines[1]
+        else:
+            side_to_move = "white"
+            engine_to_move = engines[0]
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from engine import Engine
+from games import run_game
+from mock_engine import MockEngine
+
+MOCK_ENGINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_engine.py")
+
+# long enough that the mocks never flag, short enough to be obviously fake
+BENCH_CLOCK = 10**9
+
+
+def _timed(f):
+    # wall and harness cpu seconds for f()
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = f()
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def bench_spawn(count):
+    # time to a usable engine: process start plus the uci handshake
+    def spawn_subprocess():
+        for _ in range(count):
+            engine = Engine(MOCK_ENGINE_PATH)
+            engine.is_ready()
+            del engine
+
+    def spawn_in_process():
+        for _ in range(count):
+            engine = MockEngine()
+            engine.is_ready()
+            del engine
+
+    _, subprocess_wall, _ = _timed(spawn_subprocess)
+    _, in_process_wall, _ = _timed(spawn_in_process)
+    return {
+        "subprocess_ms": 1000. * subprocess_wall / count,
+        "in_process_ms": 1000. * in_process_wall / count,
+    }
+
+
+def bench_games(count):
+    # the mocks answer instantly, so this is as fast as the harness can
+    # drive games.  cpu time is only our own process
+    def play():
+        plies = 0
+        for i in range(count):
+            e1 = Engine(MOCK_ENGINE_PATH, {"MockSeed": 2 * i})
+            e2 = Engine(MOCK_ENGINE_PATH, {"MockSeed": 2 * i + 1})
+            _, move_count, _ = run_game(e1, e2, BENCH_CLOCK, 0)
+            plies += 2 * move_count
+        return plies
+
+    plies, wall, cpu = _timed(play)
+    return {
+        "games": count,
+        "plies": plies,
+        "plies_per_sec": plies / wall if wall else 0.,
+        "harness_cpu_us_per_ply": 1e6 * cpu / plies if plies else 0.,
+    }
+
+
+def bench_info_lines(searches, lines_per_search):
+    engine = Engine(MOCK_ENGINE_PATH, {"MockInfoLines": lines_per_search})
+    engine.is_ready()
+    engine.give_history([])
+
+    def search():
+        for _ in range(searches):
+            engine.go_w_movetime(0)
+
+    _, wall, cpu = _timed(search)
+    lines = searches * lines_per_search
+    return {
+        "lines": lines,
+        "lines_per_sec": lines / wall if wall else 0.,
+        "harness_cpu_us_per_line": 1e6 * cpu / lines if lines else 0.,
+    }
+
+
+def bench_memory(concurrency):
+    # python side memory held per in-flight game.  each game runs in its
+    # own thread against subprocess mocks, so the mocks don't count
+    engines = [(Engine(MOCK_ENGINE_PATH, {"MockSeed": 2 * i}), Engine(MOCK_ENGINE_PATH, {"MockSeed": 2 * i + 1}))
+               for i in range(concurrency)]
+
+    tracemalloc.start()
+    threads = [threading.Thread(target=run_game, args=(e1, e2, BENCH_CLOCK, 0)) for e1, e2 in engines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "concurrency": concurrency,
+        "peak_kb": peak / 1024.,
+        "kb_per_game": peak / 1024. / concurrency,
+    }
+
+
+def print_harness_bench(results, baseline=None):
+    rows = [
+        ("engine spawn (subprocess)", "spawn", "subprocess_ms", "ms"),
+        ("engine spawn (in process)", "spawn", "in_process_ms", "ms"),
+        ("plies / sec", "games", "plies_per_sec", ""),
+        ("harness cpu / ply", "games", "harness_cpu_us_per_ply", "us"),
+        ("info lines / sec", "info_lines", "lines_per_sec", ""),
+        ("harness cpu / info line", "info_lines", "harness_cpu_us_per_line", "us"),
+        ("memory / concurrent game", "memory", "kb_per_game", "KB"),
+    ]
+    for label, section, key, unit in rows:
+        value = results[section][key]
+        line = f"{label:<28} {value:>14.2f} {unit}"
+        if baseline is not None and baseline.get(section, {}).get(key):
+            line += f"  ({value / baseline[section][key]:.3f}x baseline)"
+        print(line)
+
+
+def run_harness_bench(settings):
+    games = settings.harness_bench_games
+    concurrency = settings.harness_bench_concurrency
+
+    print("Starting harness bench")
+    results = {
+        "timestamp": int(time.time()),
+        "spawn": bench_spawn(5),
+        "games": bench_games(games),
+        "info_lines": bench_info_lines(20, 5000),
+        "memory": bench_memory(concurrency),
+    }
+
+    baseline = None
+    if settings.harness_bench_compare is not None:
+        with open(settings.harness_bench_compare) as f:
+            baseline = json.load(f)
+
+    print()
+    print_harness_bench(results, baseline)
+
+    with open(settings.harness_bench_output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Harness bench results saved to {settings.harness_bench_output}")
+
+    return results
@@ -0,0 +1,133 @@
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# game end reasons that mean an engine misbehaved rather than lost
+CRASH_REASONS = ("illegal move", "crash", "resource limit")
+
+
+def elo_estimate(wins, draws, losses):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.
+    score = (wins + draws / 2.) / games
+    # clamp so a perfect score doesn't send us to infinity
+    score = min(max(score, 1. / (2 * games)), 1. - 1. / (2 * games))
+    return -400. * math.log10(1. / score - 1.)
+
+
+class Metrics:
+    # counters for a long run, exposed in prometheus text format over http
+    # and/or as a periodically rewritten file
+    def __init__(self, port=None, fname=None, interval=10):
+        self.port = port
+        self.fname = fname
+        self.interval = interval
+        self.start_time = time.time()
+
+        self._lock = threading.Lock()
+        self.games = 0
+        self.record = [0, 0, 0]         # from the tested engine's side
+        self.timeouts = 0
+        self.crashes = 0
+        self.moves = 0
+        self.overhead_ms = 0.
+        self.nodes = 0
+        self.search_ms = 0
+
+        self._server = None
+        self._stop = threading.Event()
+        self._writer = None
+
+    def record_move(self, overhead_ms, nodes=None, search_ms=None):
+        with self._lock:
+            self.moves += 1
+            self.overhead_ms += overhead_ms
+            if nodes and search_ms:
+                self.nodes += nodes
+                self.search_ms += search_ms
+
+    def record_game(self, result, reason):
+        # result is 1 / 0.5 / 0 for the tested engine
+        with self._lock:
+            self.games += 1
+            self.record[int(2 - result * 2)] += 1
+            if reason == "timeout":
+                self.timeouts += 1
+            elif reason in CRASH_REASONS:
+                self.crashes += 1
+
+    def render(self):
+        with self._lock:
+            elapsed_hours = (time.time() - self.start_time) / 3600.
+            wins, draws, losses = self.record
+            values = [
+                ("games_completed_total", "counter", "Games finished", [("", self.games)]),
+                ("games_per_hour", "gauge", "Games finished per hour since start",
+                 [("", self.games / elapsed_hours if elapsed_hours else 0.)]),
+                ("results_total", "counter", "Game results for the tested engine",
+                 [('{result="win"}', wins), ('{result="draw"}', draws), ('{result="loss"}', losses)]),
+                ("elo_estimate", "gauge", "Elo difference estimated from the current record",
+                 [("", elo_estimate(wins, draws, losses))]),
+                ("timeouts_total", "counter", "Games lost on time", [("", self.timeouts)]),
+                ("crashes_total", "counter", "Games ended by a crashed or misbehaving engine", [("", self.crashes)]),
+                ("harness_overhead_ms", "gauge", "Average time per move spent outside engine searches",
+                 [("", self.overhead_ms / self.moves if self.moves else 0.)]),
+                ("engine_nps", "gauge", "Average engine nodes per second",
+                 [("", 1000. * self.nodes / self.search_ms if self.search_ms else 0.)]),
+            ]
+
+        lines = []
+        for name, kind, description, samples in values:
+            lines.append(f"# HELP endian_{name} {description}")
+            lines.append(f"# TYPE endian_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"endian_{name}{labels} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write_file(self):
+        # write and rename so a scraper never sees half a file
+        tmp_fname = f"{self.fname}.tmp"
+        with open(tmp_fname, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_fname, self.fname)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self.write_file()
+
+    def start(self):
+        if self.port is not None:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = metrics.render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+
+        if self.fname is not None:
+            self.write_file()
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+            print(f"Writing metrics to {self.fname} every {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self.fname is not None:
+            self.write_file()
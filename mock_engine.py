@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# A scriptable stand-in for a real UCI engine.  It can run as its own
+# process (point --engine at this file) or inside the harness process
+# through MockEngine, and is configured with ordinary setoption commands:
+#
+#   MockDelay      milliseconds to "think" on every go
+#   MockInfoLines  info lines to emit before bestmove
+#   MockMoves      space separated uci moves to play in order while legal
+#   MockSeed       seed for picking among legal moves otherwise
+#
+# "go perft N" is answered with a divide, for checking the perft mode.
+
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+
+import chess
+
+import perft
+from engine import Engine
+
+MOCK_OPTIONS = [
+    "option name Hash type spin default 16 min 1 max 65536",
+    "option name Threads type spin default 1 min 1 max 1024",
+    "option name MultiPV type spin default 1 min 1 max 256",
+    "option name MockDelay type spin default 0 min 0 max 1000000",
+    "option name MockInfoLines type spin default 1 min 0 max 1000000",
+    "option name MockMoves type string default <empty>",
+    "option name MockSeed type spin default 0 min 0 max 2147483647",
+]
+
+INFO_LINES_PER_DEPTH = 50
+
+
+class MockUCI:
+    def __init__(self, name="mock", delay=0, info_lines=1, moves=None, seed=0):
+        self.name = name
+        self.delay = delay
+        self.info_lines = info_lines
+        self.moves = list(moves or [])
+        self.rng = random.Random(seed)
+        self.board = chess.Board()
+
+    def _set_option(self, tokens):
+        # setoption name <name> value <value>
+        if "value" not in tokens:
+            return
+        value_idx = tokens.index("value")
+        name = ' '.join(tokens[2:value_idx])
+        value = ' '.join(tokens[value_idx + 1:])
+        if name == "MockDelay":
+            self.delay = int(value)
+        elif name == "MockInfoLines":
+            self.info_lines = int(value)
+        elif name == "MockMoves":
+            self.moves = value.split() if value != "<empty>" else []
+        elif name == "MockSeed":
+            self.rng = random.Random(int(value))
+
+    def _position(self, tokens):
+        if tokens[1] == "fen":
+            end = tokens.index("moves") if "moves" in tokens else len(tokens)
+            self.board = chess.Board(' '.join(tokens[2:end]))
+        else:
+            self.board = chess.Board()
+        if "moves" in tokens:
+            for move in tokens[tokens.index("moves") + 1:]:
+                self.board.push_uci(move)
+
+    def _choose_move(self):
+        ply = len(self.board.move_stack)
+        if ply < len(self.moves):
+            move = chess.Move.from_uci(self.moves[ply])
+            if move in self.board.legal_moves:
+                return move
+        legal_moves = list(self.board.legal_moves)
+        if not legal_moves:
+            return None
+        return self.rng.choice(legal_moves)
+
+    def _go(self, out):
+        start_time = time.time()
+        move = self._choose_move()
+        uci_move = move.uci() if move is not None else "0000"
+
+        # like a real search, mostly currmove/nodes chatter with a pv line
+        # whenever a depth completes
+        lines = []
+        for i in range(self.info_lines):
+            depth = i // INFO_LINES_PER_DEPTH + 1
+            if i % INFO_LINES_PER_DEPTH == INFO_LINES_PER_DEPTH - 1 or i == self.info_lines - 1:
+                lines.append(f"info depth {depth} seldepth {depth} multipv 1 score cp {depth % 50} "
+                             f"nodes {(i + 1) * 1000} nps 1000000 time {i + 1} pv {uci_move}\n")
+            else:
+                lines.append(f"info depth {depth} currmove {uci_move} currmovenumber {i % INFO_LINES_PER_DEPTH + 1} "
+                             f"nodes {(i + 1) * 1000} nps 1000000\n")
+        if lines:
+            out.write(''.join(lines))
+
+        remaining = self.delay / 1000. - (time.time() - start_time)
+        if remaining > 0:
+            time.sleep(remaining)
+        out.write(f"bestmove {uci_move}\n")
+        out.flush()
+
+    def _perft(self, depth, out):
+        # stockfish style divide
+        total = 0
+        for move in list(self.board.legal_moves):
+            self.board.push(move)
+            count = perft.count_nodes(self.board, depth - 1)
+            self.board.pop()
+            total += count
+            out.write(f"{move.uci()}: {count}\n")
+        out.write(f"\nNodes searched: {total}\n\n")
+        out.flush()
+
+    def handle(self, line, out):
+        # returns False once the engine should exit
+        tokens = line.split()
+        if not tokens:
+            return True
+        cmd = tokens[0]
+        if cmd == "uci":
+            out.write(f"id name {self.name}\nid author endian\n")
+            out.write('\n'.join(MOCK_OPTIONS) + "\nuciok\n")
+            out.flush()
+        elif cmd == "isready":
+            out.write("readyok\n")
+            out.flush()
+        elif cmd == "setoption":
+            self._set_option(tokens)
+        elif cmd == "ucinewgame":
+            self.board = chess.Board()
+        elif cmd == "position":
+            self._position(tokens)
+        elif cmd == "go" and "perft" in tokens:
+            self._perft(int(tokens[tokens.index("perft") + 1]), out)
+        elif cmd == "go":
+            self._go(out)
+        elif cmd == "quit":
+            return False
+        return True
+
+    def run(self, infile, outfile):
+        for line in infile:
+            if not self.handle(line, outfile):
+                break
+        outfile.close()
+
+
+_mock_pids = itertools.count(-1, -1)
+
+
+class MockProcess:
+    # just enough of the Popen interface for Engine, backed by a thread
+    def __init__(self, mock):
+        to_engine_r, to_engine_w = os.pipe()
+        from_engine_r, from_engine_w = os.pipe()
+        self.stdin = os.fdopen(to_engine_w, "wb")
+        self.stdout = os.fdopen(from_engine_r, "rb")
+        self.pid = next(_mock_pids)
+        self.returncode = None
+
+        infile = os.fdopen(to_engine_r, "r")
+        outfile = os.fdopen(from_engine_w, "w")
+        self.thread = threading.Thread(target=mock.run, args=(infile, outfile), daemon=True)
+        self.thread.start()
+
+    def poll(self):
+        if self.returncode is None and not self.thread.is_alive():
+            self.returncode = 0
+        return self.returncode
+
+    def terminate(self):
+        # closing stdin is an EOF for the mock, which ends its thread
+        if not self.stdin.closed:
+            self.stdin.close()
+
+    def kill(self):
+        self.terminate()
+
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+        return self.poll()
+
+
+class MockEngine(Engine):
+    def __init__(self, settings={}, name="mock", **mock_options):
+        self.mock_options = dict(mock_options, name=name)
+        super().__init__(name, settings)
+
+    def _spawn(self):
+        return MockProcess(MockUCI(**self.mock_options))
+
+
+if __name__ == "__main__":
+    MockUCI().run(sys.stdin, sys.stdout)
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+import weakref
+
+try:
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (ValueError, OSError, AttributeError):
+    CLOCK_TICKS = 100
+    PAGE_SIZE = 4096
+
+# set by start_monitor, engines register themselves with it if it exists
+MONITOR = None
+
+
+def read_proc(pid):
+    # (rss bytes, cpu seconds, threads, voluntary switches, involuntary switches)
+    # or None if the process is gone
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+        tids = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return None
+
+    # the command name can contain spaces, so split after it
+    fields = stat[stat.rindex(')') + 2:].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    threads = int(fields[17])
+    rss = int(fields[21]) * PAGE_SIZE
+
+    # the process status only counts the main thread's switches, search
+    # threads each have their own
+    voluntary, involuntary = 0, 0
+    for tid in tids:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/status") as f:
+                status = f.read()
+        except OSError:
+            # thread exited since the listing
+            continue
+        for line in status.split('\n'):
+            if line.startswith("voluntary_ctxt_switches"):
+                voluntary += int(line.split()[1])
+            elif line.startswith("nonvoluntary_ctxt_switches"):
+                involuntary += int(line.split()[1])
+    return rss, cpu_seconds, threads, voluntary, involuntary
+
+
+def summarize(samples):
+    # samples are (time, pid, rss, cpu, threads, voluntary, involuntary).
+    # counters restart with the process, so only add up deltas within a pid.
+    # switch counts can also drop when a thread exits, which isn't negative work
+    if not samples:
+        return {}
+    cpu_seconds, voluntary, involuntary = 0., 0, 0
+    for prev, cur in zip(samples, samples[1:]):
+        if prev[1] == cur[1]:
+            cpu_seconds += cur[3] - prev[3]
+            voluntary += max(0, cur[5] - prev[5])
+            involuntary += max(0, cur[6] - prev[6])
+    return {
+        "samples": len(samples),
+        "peak_rss_mb": round(max(s[2] for s in samples) / (1024 * 1024), 1),
+        "cpu_seconds": round(cpu_seconds, 2),
+        "max_threads": max(s[4] for s in samples),
+        "voluntary_ctxt_switches": voluntary,
+        "involuntary_ctxt_switches": involuntary,
+    }
+
+
+def format_summary(summary):
+    if not summary:
+        return "no samples"
+    return (f"peak rss {summary['peak_rss_mb']} MB, cpu {summary['cpu_seconds']}s, "
+            f"threads {summary['max_threads']}, ctx switches "
+            f"{summary['voluntary_ctxt_switches']}/{summary['involuntary_ctxt_switches']}")
+
+
+class ResourceMonitor:
+    # one thread sampling every registered engine from /proc
+    def __init__(self, interval=1., max_rss_mb=None, max_threads=None):
+        self.interval = interval
+        self.max_rss_mb = max_rss_mb
+        self.max_threads = max_threads
+        self._engines = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def register(self, engine):
+        with self._lock:
+            self._engines.add(engine)
+
+    def _check_limits(self, engine, rss, threads):
+        if self.max_rss_mb is not None and rss > self.max_rss_mb * 1024 * 1024:
+            return f"rss {rss // (1024 * 1024)} MB over limit"
+        if self.max_threads is not None and threads > self.max_threads:
+            return f"{threads} threads over limit"
+        return None
+
+    def sample(self):
+        with self._lock:
+            engines = list(self._engines)
+        now = time.time()
+        for engine in engines:
+            pid = engine.pid
+            if pid <= 0:
+                continue
+            stats = read_proc(pid)
+            if stats is None:
+                continue
+            rss, cpu_seconds, threads, voluntary, involuntary = stats
+            engine.resource_samples.append((now, pid, rss, cpu_seconds, threads, voluntary, involuntary))
+
+            violation = self._check_limits(engine, rss, threads)
+            if violation is not None and engine.kill_reason is None:
+                print(f"Killing {engine.name or engine.path}: {violation}")
+                engine.kill_reason = "resource limit"
+                engine.e.kill()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def start_monitor(interval, max_rss_mb=None, max_threads=None):
+    global MONITOR
+    MONITOR = ResourceMonitor(interval, max_rss_mb, max_threads)
+    MONITOR.start()
+    return MONITOR
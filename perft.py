@@ -0,0 +1,174 @@
+import json
+import multiprocessing
+import os
+import re
+import time
+
+import chess
+
+from engine import EngineError
+from preflight import take_engine
+
+# the usual suspects, covering castling, en passant and promotion edge cases
+PERFT_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+]
+
+DIVIDE_RE = re.compile(r"^([a-h][1-8][a-h][1-8][qrbn]?)\s*:?\s*(\d+)$")
+TOTAL_RE = re.compile(r"^(?:nodes searched|total nodes|total|nodes)\s*:?\s*(\d+)$", re.IGNORECASE)
+
+# an engine slower than this at perft is assumed to be stuck, most likely
+# searching because it took the perft command for a plain go
+PERFT_MIN_NPS = 100000
+
+
+def count_nodes(board, depth):
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += count_nodes(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def _divide_task(fen, move, depth):
+    board = chess.Board(fen)
+    board.push(chess.Move.from_uci(move))
+    return count_nodes(board, depth - 1)
+
+
+def load_perft_suite(fname):
+    # one position per line, anything after the first ';' (like the
+    # D1/D2 counts in perftsuite.epd) is ignored
+    fens = []
+    with open(fname) as f:
+        for line in f:
+            fen = line.split(';')[0].strip()
+            if not fen:
+                continue
+            if len(fen.split()) == 4:
+                fen += " 0 1"
+            fens.append(fen)
+    return fens
+
+
+def _cache_key(fen, depth):
+    return f"{fen}|{depth}"
+
+
+def reference_divides(fens, depth, cache_dir=None, workers=None):
+    # {fen: {move: count}} from python-chess.  slow, so every root move of
+    # every position is farmed out separately and the answers are cached
+    cache_fname = os.path.join(cache_dir, "perft_reference.json") if cache_dir is not None else None
+    cache = {}
+    if cache_fname is not None and os.path.isfile(cache_fname):
+        with open(cache_fname) as f:
+            cache = json.load(f)
+
+    missing = [fen for fen in fens if _cache_key(fen, depth) not in cache]
+    if missing:
+        tasks = []
+        for fen in missing:
+            board = chess.Board(fen)
+            tasks += [(fen, move.uci(), depth) for move in board.legal_moves]
+
+        print(f"Computing reference perft for {len(missing)} positions at depth {depth}...")
+        with multiprocessing.Pool(workers) as pool:
+            counts = pool.starmap(_divide_task, tasks)
+
+        for fen in missing:
+            cache[_cache_key(fen, depth)] = {}
+        for (fen, move, _), count in zip(tasks, counts):
+            cache[_cache_key(fen, depth)][move] = count
+
+        if cache_fname is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_fname = f"{cache_fname}.tmp"
+            with open(tmp_fname, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_fname, cache_fname)
+
+    return {fen: cache[_cache_key(fen, depth)] for fen in fens}
+
+
+def engine_divide(engine, fen, depth, command, timeout):
+    # returns ({move: count}, total or None, milliseconds)
+    engine.give_fen(fen)
+    start_time = time.time()
+    engine.send_uci(command.format(depth=depth))
+
+    divide = {}
+    while True:
+        remaining = start_time + timeout - time.time()
+        line = engine.reader.readline(max(0., remaining))
+        if not line and engine.reader.eof:
+            raise EngineError(f"{engine.name} exited during perft")
+        if not line and remaining <= 0:
+            raise EngineError(f"no perft total from {engine.name} within {timeout:.0f}s, "
+                              f"does it understand '{command.format(depth=depth)}'?")
+        line = line.decode("utf-8").strip()
+        match = DIVIDE_RE.match(line)
+        if match:
+            divide[match.group(1)] = int(match.group(2))
+            continue
+        match = TOTAL_RE.match(line)
+        if match:
+            duration = int((time.time() - start_time) * 1000)
+            return divide, int(match.group(1)), duration
+
+
+def run_perft(settings):
+    depth = settings.perft_depth
+    command = settings.perft_command
+    if settings.perft_suite is not None:
+        fens = load_perft_suite(settings.perft_suite)
+    else:
+        fens = PERFT_POSITIONS
+
+    print("Starting perft")
+    print(f"Positions: {len(fens)}, depth {depth}, command: {command.format(depth=depth)}")
+    references = reference_divides(fens, depth, settings.cache_dir, settings.concurrency)
+
+    engine = take_engine(settings.engine, settings.engine_settings)
+    passed = 0
+    total_nodes, total_ms = 0, 0
+    for fen in fens:
+        reference = references[fen]
+        expected = sum(reference.values())
+        timeout = settings.perft_timeout + expected / PERFT_MIN_NPS
+        try:
+            divide, nodes, duration = engine_divide(engine, fen, depth, command, timeout)
+        except EngineError as e:
+            print(f"FAIL {e}  {fen}")
+            # whatever it was doing, start over for the next position
+            engine.restart()
+            continue
+
+        nps = int(nodes * 1000 / duration) if duration else 0
+        total_nodes += nodes
+        total_ms += duration
+        # the divide is only checked if the engine printed one
+        ok = nodes == expected and (not divide or divide == reference)
+        if ok:
+            passed += 1
+        print(f"{'OK  ' if ok else 'FAIL'} {nodes:>12} / {expected:<12} {duration:>7} ms {nps:>11} nps  {fen}")
+
+        if not ok and divide:
+            for move in sorted(set(divide) | set(reference)):
+                if divide.get(move) != reference.get(move):
+                    print(f"     {move}: engine {divide.get(move, 'missing')}, expected {reference.get(move, 'illegal')}")
+
+    if total_ms:
+        print(f"Overall: {total_nodes} nodes in {total_ms} ms, {int(total_nodes * 1000 / total_ms)} nps")
+    print(f"Perft passed: {passed} / {len(fens)}")
+
+    return passed, len(fens)
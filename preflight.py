@@ -0,0 +1,140 @@
+import threading
+import time
+
+import monitor
+from engine import Engine
+
+# set by run_preflight: engines that finished their handshake and are
+# waiting to be picked up by the first mode that needs them
+WARM_ENGINES = {}
+_warm_lock = threading.Lock()
+
+
+def take_engine(path, settings={}, cpus=None):
+    # a warm engine for `path` if preflight left one, otherwise a new one
+    with _warm_lock:
+        engines = WARM_ENGINES.get(path)
+        engine = engines.pop() if engines else None
+    if engine is None:
+        return Engine(path, settings, cpus=cpus)
+
+    engine.reconfigure(settings, cpus)
+    if monitor.MONITOR is not None:
+        monitor.MONITOR.register(engine)
+    return engine
+
+
+def check_options(engine, settings):
+    # problems with `settings` according to the options the engine advertised
+    problems = []
+    for name, value in settings.items():
+        spec = engine.options.get(name.lower())
+        if spec is None:
+            problems.append(f"unknown option {name}")
+            continue
+        kind = spec.get("type")
+        value = str(value)
+        if kind == "spin":
+            try:
+                number = int(value)
+            except ValueError:
+                problems.append(f"{name} must be an integer, not {value}")
+                continue
+            low, high = spec.get("min"), spec.get("max")
+            if (low is not None and number < int(low)) or (high is not None and number > int(high)):
+                problems.append(f"{name} {value} outside {low}..{high}")
+        elif kind == "check" and value.lower() not in ("true", "false"):
+            problems.append(f"{name} must be true or false, not {value}")
+        elif kind == "combo" and value.lower() not in (v.lower() for v in spec["var"]):
+            problems.append(f"{name} must be one of {', '.join(spec['var'])}, not {value}")
+    return problems
+
+
+def referenced_engines(settings):
+    # {path: (options to start with, options to check, whether a mode will
+    # take the warm engine)} for every engine some enabled mode will start.
+    # bench, calibration and self-play start their own engines, so theirs
+    # are only checked
+    engine_settings = settings.engine_settings
+    engines = {}
+    if settings.engine is not None:
+        checks = dict(engine_settings)
+        if settings.analyze:
+            checks["MultiPV"] = settings.analysis_multipv
+        warm = settings.run_games or settings.run_puzzles or settings.compare_elo or settings.analyze \
+            or settings.perft or settings.annotate
+        engines[settings.engine] = (engine_settings, checks, bool(warm))
+    if settings.run_games:
+        for path in settings.vs_engines:
+            engines.setdefault(path, (engine_settings, engine_settings, True))
+    if settings.compare_elo:
+        engines.setdefault(settings.rival_engine, (engine_settings, engine_settings, True))
+    if settings.calibrate and settings.calibration_engine is not None:
+        # calibration only ever sets Threads and Hash itself
+        engines.setdefault(settings.calibration_engine, ({}, {}, False))
+    return engines
+
+
+def _start_engine(path, settings, results):
+    start_time = time.time()
+    try:
+        engine = Engine(path, settings)
+    except Exception as e:
+        # missing binary, no permission, or it died during the handshake
+        results[path] = (None, f"{type(e).__name__}: {e}")
+        return
+    results[path] = (engine, int((time.time() - start_time) * 1000))
+
+
+def start_engines(engines, timeout):
+    # {path: options} through uci / setoption / isready all at once.  threads
+    # are daemons so an engine that never answers can't keep us from exiting
+    results = {}
+    threads = [threading.Thread(target=_start_engine, args=(path, settings, results), daemon=True)
+               for path, settings in engines.items()]
+    for thread in threads:
+        thread.start()
+
+    deadline = time.time() + timeout
+    for thread in threads:
+        thread.join(max(0., deadline - time.time()))
+
+    for path in engines:
+        if path not in results:
+            results[path] = (None, f"no readyok within {timeout}s")
+    return results
+
+
+def run_preflight(settings):
+    engines = referenced_engines(settings)
+    if not engines:
+        return True
+
+    print(f"Preflight: starting {len(engines)} engines")
+    results = start_engines({path: options for path, (options, _, _) in engines.items()},
+                            settings.preflight_timeout)
+
+    ok = True
+    for path, (_, checks, warm) in engines.items():
+        engine, outcome = results[path]
+        if engine is None:
+            ok = False
+            print(f"  FAIL {path}: {outcome}")
+            continue
+
+        problems = check_options(engine, checks)
+        if problems:
+            ok = False
+            print(f"  FAIL {path} ({engine.full_name}): {'; '.join(problems)}")
+            continue
+
+        print(f"  OK   {path} ({engine.full_name}): uciok {engine.handshake_ms} ms, readyok {outcome} ms")
+        if warm:
+            with _warm_lock:
+                WARM_ENGINES.setdefault(path, []).append(engine)
+        else:
+            # nothing will take it, don't leave it holding its hash all run
+            engine.send_uci("quit")
+    print()
+
+    return ok
@@ -0,0 +1,102 @@
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# automatic hash sizes stop here.  anything bigger should be asked for
+# explicitly in engine_settings
+MAX_AUTO_HASH_MB = 1024
+
+
+def allowed_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_cores():
+    # logical cpus grouped by the physical core they share (SMT siblings),
+    # limited to the cpus this process is allowed to run on
+    cores = {}
+    for cpu in allowed_cpus():
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(os.path.join(topology, "core_id")) as f:
+                core_id = int(f.read())
+            with open(os.path.join(topology, "physical_package_id")) as f:
+                package_id = int(f.read())
+        except (OSError, ValueError):
+            # no topology information, treat every cpu as its own core
+            core_id, package_id = cpu, 0
+        cores.setdefault((package_id, core_id), []).append(cpu)
+    return [sorted(cpus) for _, cpus in sorted(cores.items())]
+
+
+def default_concurrency(threads_per_slot=1):
+    return max(1, len(physical_cores()) // threads_per_slot)
+
+
+def _floor_power_of_two(n):
+    power = 1
+    while power * 2 <= n:
+        power *= 2
+    return power
+
+
+class Slot:
+    # a set of cores (and a share of memory) that one game, or one
+    # engine, has to itself
+    def __init__(self, cpus, hash_mb, pin=True):
+        self.cpus = cpus
+        self.hash_mb = hash_mb
+        self.pin = pin
+
+    def options(self, engine_settings):
+        # anything set explicitly wins over the automatic values
+        options = {"Threads": len(self.cpus)}
+        if self.hash_mb is not None:
+            options["Hash"] = self.hash_mb
+        options.update(engine_settings)
+        return options
+
+    def affinity(self):
+        return self.cpus if self.pin else None
+
+
+def allocate_slots(concurrency, engines_per_slot=2, memory_budget_mb=None, pin=True):
+    cores = physical_cores()
+    if concurrency <= len(cores):
+        # only the first sibling of each core, so engines in different
+        # slots never share a physical core through SMT
+        per_slot = len(cores) // concurrency
+        slot_cpus = [[core[0] for core in cores[i * per_slot:(i + 1) * per_slot]] for i in range(concurrency)]
+    else:
+        # asked to oversubscribe, hand out logical cpus round robin
+        logical = sum(cores, [])
+        slot_cpus = [[logical[i % len(logical)]] for i in range(concurrency)]
+
+    # without a budget engines keep whatever Hash they are configured with
+    hash_mb = None
+    if memory_budget_mb is not None:
+        hash_mb = min(MAX_AUTO_HASH_MB, _floor_power_of_two(max(1, memory_budget_mb // (concurrency * engines_per_slot))))
+
+    return [Slot(cpus, hash_mb, pin=pin) for cpus in slot_cpus]
+
+
+def run_in_slots(tasks, slots):
+    # run each task (a callable taking a Slot) as soon as a slot is free.
+    # results are yielded in the order tasks finish
+    free_slots = queue.Queue()
+    for slot in slots:
+        free_slots.put(slot)
+
+    def run(task):
+        slot = free_slots.get()
+        try:
+            return task(slot)
+        finally:
+            free_slots.put(slot)
+
+    with ThreadPoolExecutor(max_workers=len(slots)) as pool:
+        futures = [pool.submit(run, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
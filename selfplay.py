@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import random
+import time
+
+import chess
+
+from engine import Engine, kill_all_engines
+from games import run_game
+from metrics import CRASH_REASONS
+from resources import allocate_slots
+from training_data import pack_position, write_records
+
+
+def _random_opening(rng, plies):
+    # random plies from the start position, retrying if we walk into a
+    # finished game
+    while True:
+        board = chess.Board()
+        moves = []
+        for _ in range(plies):
+            legal_moves = list(board.legal_moves)
+            if not legal_moves:
+                break
+            move = rng.choice(legal_moves)
+            board.push(move)
+            moves.append(move)
+        if not board.is_game_over():
+            return moves
+
+
+def _pack_game(positions, winner, start_ply):
+    records = []
+    for i, (board, score) in enumerate(positions):
+        if score is None:
+            continue
+        white_result = int(winner * 2) - 1  # 1, 0, -1
+        if board.turn == chess.WHITE:
+            records.append(pack_position(board, score, white_result, start_ply + i))
+        else:
+            records.append(pack_position(board, -score, -white_result, start_ply + i))
+    return records
+
+
+def _selfplay_worker(worker_idx, config):
+    rng = random.Random(config['seed'] * 1000003 + worker_idx)
+    shard = os.path.join(config['output'], f"shard_{worker_idx:03d}.bin")
+
+    games, positions_written = 0, 0
+    try:
+        slot = config['slot']
+        engine = Engine(config['engine'], slot.options(config['engine_settings']), cpus=slot.affinity())
+        for _ in range(config['games']):
+            starting_moves = _random_opening(rng, config['random_plies'])
+            positions = []
+            engine.new_game()
+            # the same process plays both sides
+            winner, _, reason = run_game(
+                engine,
+                engine,
+                0,
+                0,
+                starting_moves,
+                nodes=config['nodes'],
+                adjudication=config['adjudication'],
+                positions=positions)
+
+            if reason in CRASH_REASONS:
+                # don't train on a game a crash decided
+                engine.restart()
+                continue
+
+            records = _pack_game(positions, winner, len(starting_moves))
+            write_records(shard, records)
+            games += 1
+            positions_written += len(records)
+    finally:
+        kill_all_engines()
+
+    return games, positions_written
+
+
+def run_selfplay(settings):
+    workers = settings.selfplay_workers or settings.concurrency
+    # self-play engines play both sides, so a slot only holds one of them
+    slots = allocate_slots(workers, engines_per_slot=1, memory_budget_mb=settings.memory_budget_mb, pin=settings.pin_cpus)
+    total_games = settings.selfplay_games
+    output = settings.selfplay_output
+    seed = settings.selfplay_seed
+    if seed is None:
+        seed = random.randrange(2**31)
+    os.makedirs(output, exist_ok=True)
+
+    print("Starting self-play data generation")
+    print(f"Games: {total_games}, nodes per move: {settings.selfplay_nodes}, workers: {workers}")
+    print(f"Writing shards to {output} (seed {seed})")
+
+    configs = []
+    for i in range(workers):
+        # spread the remainder over the first few workers
+        games = total_games // workers + (1 if i < total_games % workers else 0)
+        configs.append((i, {
+            'engine': settings.engine,
+            'engine_settings': settings.engine_settings,
+            'slot': slots[i],
+            'output': output,
+            'games': games,
+            'nodes': settings.selfplay_nodes,
+            'random_plies': settings.selfplay_random_plies,
+            'seed': seed,
+            'adjudication': settings.adjudication,
+        }))
+
+    start_time = time.time()
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.starmap(_selfplay_worker, configs)
+
+    games = sum(r[0] for r in results)
+    positions = sum(r[1] for r in results)
+    elapsed = time.time() - start_time
+    print(f"Self-play complete: {games} games, {positions} positions in {elapsed:.1f}s")
+
+    return games, positions
@@ -4,11 +4,34 @@ import os
 
 import chess.polyglot
 
+from annotate import ANNOTATE_FORMATS
+from book_builder import RESULT_FILTERS
+from game_store import GameStore
+from metrics import Metrics
+from resources import default_concurrency
+
 DEFAULT_SETTINGS = {
     'engine': None,
     'config': 'configs/config.json',
     'no_config': False,
     'engine_settings': {},
+    'cache_dir': '.endian_cache',
+    'concurrency': None,
+    'no_pin_cpus': False,
+    'memory_budget_mb': None,
+    'metrics_port': None,
+    'metrics_file': None,
+    'metrics_interval': 10,
+    'monitor_interval': 1.0,
+    'engine_max_rss_mb': None,
+    'engine_max_threads': None,
+    'no_preflight': False,
+    'preflight_timeout': 30,
+
+    'calibrate': False,
+    'calibration_engine': None,
+    'calibration_movetime': 1000,
+    'reference_nps': None,
 
     'run_games': False,
 
@@ -19,6 +42,7 @@ DEFAULT_SETTINGS = {
     'opening_book': None,
     'opening_book_max_ply': 10,
     'opening_fen': None,
+    'game_store': None,
 
     'clock_time': 30000,
     'clock_inc': 1000,
@@ -31,7 +55,63 @@ DEFAULT_SETTINGS = {
     'rival_engine': None,
     'elo_clock_time': 1000,
     'elo_inc': 80,
-    'elo_rounds': 100
+    'elo_rounds': 100,
+
+    'analyze': False,
+    'analysis_multipv': 3,
+    'analysis_output': 'analysis.jsonl',
+
+    'selfplay': False,
+    'selfplay_games': 1000,
+    'selfplay_nodes': 5000,
+    'selfplay_random_plies': 8,
+    'selfplay_output': 'selfplay/',
+    'selfplay_workers': None,
+    'selfplay_seed': None,
+
+    'adjudicate_resign_score': 1000,
+    'adjudicate_resign_plies': 6,
+    'adjudicate_draw_score': 10,
+    'adjudicate_draw_plies': 12,
+    'adjudicate_draw_min_ply': 80,
+
+    'bench': False,
+    'bench_depth': None,
+    'bench_movetime': 1000,
+    'bench_max_threads': None,
+    'bench_hash': [16],
+    'bench_repeats': 3,
+    'bench_positions': None,
+    'bench_output': 'bench.json',
+    'bench_compare': None,
+
+    'harness_bench': False,
+    'harness_bench_games': 20,
+    'harness_bench_concurrency': 8,
+    'harness_bench_output': 'harness_bench.json',
+    'harness_bench_compare': None,
+
+    'perft': False,
+    'perft_depth': 4,
+    'perft_suite': None,
+    'perft_command': 'go perft {depth}',
+    'perft_timeout': 10,
+
+    'build_book': False,
+    'book_pgns': [],
+    'book_output': 'book.bin',
+    'book_max_ply': 20,
+    'book_min_games': 2,
+    'book_results': 'all',
+    'book_workers': None,
+
+    'annotate': False,
+    'annotate_pgn': None,
+    'annotate_output': 'annotated.pgn',
+    'annotate_format': 'pgn',
+    'annotate_nodes': 100000,
+    'annotate_movetime': None,
+    'annotate_workers': None
 }
 
 
@@ -56,12 +136,28 @@ class Settings:
     def _empty_init(self):
         self.engine = None
         self.engine_settings = None
+        self.cache_dir = None
+        self.concurrency = None
+        self.pin_cpus = None
+        self.memory_budget_mb = None
+        self.metrics = None
+        self.monitor_interval = None
+        self.engine_max_rss_mb = None
+        self.engine_max_threads = None
+        self.preflight = None
+        self.preflight_timeout = None
+
+        self.calibrate = None
+        self.calibration_engine = None
+        self.calibration_movetime = None
+        self.reference_nps = None
 
         self.run_games = None
         self.engines = None
         self.opening_book = None
         self.opening_book_ply = None
         self.opening_fen = None
+        self.game_store = None
         self.clock_time = None
         self.clock_inc = None
 
@@ -69,6 +165,57 @@ class Settings:
         self.puzzle_suite = None
         self.puzzle_movetime = None
 
+        self.analyze = None
+        self.analysis_multipv = None
+        self.analysis_output = None
+
+        self.selfplay = None
+        self.selfplay_games = None
+        self.selfplay_nodes = None
+        self.selfplay_random_plies = None
+        self.selfplay_output = None
+        self.selfplay_workers = None
+        self.selfplay_seed = None
+        self.adjudication = None
+
+        self.bench = None
+        self.bench_depth = None
+        self.bench_movetime = None
+        self.bench_max_threads = None
+        self.bench_hash = None
+        self.bench_repeats = None
+        self.bench_positions = None
+        self.bench_output = None
+        self.bench_compare = None
+
+        self.harness_bench = None
+        self.harness_bench_games = None
+        self.harness_bench_concurrency = None
+        self.harness_bench_output = None
+        self.harness_bench_compare = None
+
+        self.perft = None
+        self.perft_depth = None
+        self.perft_suite = None
+        self.perft_command = None
+        self.perft_timeout = None
+
+        self.build_book = None
+        self.book_pgns = None
+        self.book_output = None
+        self.book_max_ply = None
+        self.book_min_games = None
+        self.book_results = None
+        self.book_workers = None
+
+        self.annotate = None
+        self.annotate_pgn = None
+        self.annotate_output = None
+        self.annotate_format = None
+        self.annotate_nodes = None
+        self.annotate_movetime = None
+        self.annotate_workers = None
+
     def __init__(self, arg_dict):
         # for each config param:
         #  - if it was specified as a command line param, use that value
@@ -90,6 +237,30 @@ class Settings:
 
         self.engine = _layer_settings('engine')
         self.engine_settings = _layer_settings('engine_settings', formatter=json.loads)
+        self.cache_dir = _layer_settings('cache_dir')
+
+        # by default one game per physical core
+        self.concurrency = _layer_settings('concurrency') or default_concurrency()
+        self.pin_cpus = not _layer_settings('no_pin_cpus')
+        self.memory_budget_mb = _layer_settings('memory_budget_mb')
+
+        self.monitor_interval = _layer_settings('monitor_interval')
+        self.engine_max_rss_mb = _layer_settings('engine_max_rss_mb')
+        self.engine_max_threads = _layer_settings('engine_max_threads')
+
+        self.preflight = not _layer_settings('no_preflight')
+        self.preflight_timeout = _layer_settings('preflight_timeout')
+
+        self.calibrate = _layer_settings('calibrate')
+        if self.calibrate:
+            self.calibration_engine = _layer_settings('calibration_engine')
+            self.calibration_movetime = _layer_settings('calibration_movetime')
+            self.reference_nps = _layer_settings('reference_nps')
+
+        metrics_port = _layer_settings('metrics_port')
+        metrics_file = _layer_settings('metrics_file')
+        if metrics_port is not None or metrics_file is not None:
+            self.metrics = Metrics(metrics_port, metrics_file, _layer_settings('metrics_interval'))
 
         self.run_games = _layer_settings('run_games')
 
@@ -119,11 +290,20 @@ class Settings:
         # TODO currently, you can't override this with None as it is right now...
         self.opening_fen = _layer_settings('opening_fen')
 
+        game_store_fname = _layer_settings('game_store')
+        if game_store_fname is not None:
+            try:
+                self.game_store = GameStore(game_store_fname)
+            except Exception:
+                print(f"Exception when trying to open game store {game_store_fname}")
+                raise
+
         self.clock_time = _layer_settings('clock_time')
         self.clock_inc = _layer_settings('clock_inc')
 
         self.run_puzzles = _layer_settings('run_puzzles')
-        if self.run_puzzles:
+        self.analyze = _layer_settings('analyze')
+        if self.run_puzzles or self.analyze:
             self.puzzle_suite = _layer_settings('puzzle_suite')
             self.puzzle_movetime = _layer_settings('puzzle_movetime')
 
@@ -134,18 +314,102 @@ class Settings:
             self.elo_inc = _layer_settings('elo_inc')
             self.elo_rounds = _layer_settings('elo_rounds')
 
+        if self.analyze:
+            self.analysis_multipv = _layer_settings('analysis_multipv')
+            self.analysis_output = _layer_settings('analysis_output')
+
+        self.selfplay = _layer_settings('selfplay')
+        if self.selfplay:
+            self.selfplay_games = _layer_settings('selfplay_games')
+            self.selfplay_nodes = _layer_settings('selfplay_nodes')
+            self.selfplay_random_plies = _layer_settings('selfplay_random_plies')
+            self.selfplay_output = _layer_settings('selfplay_output')
+            self.selfplay_workers = _layer_settings('selfplay_workers')
+            self.selfplay_seed = _layer_settings('selfplay_seed')
+
+        self.bench = _layer_settings('bench')
+        if self.bench:
+            self.bench_depth = _layer_settings('bench_depth')
+            self.bench_movetime = _layer_settings('bench_movetime')
+            self.bench_max_threads = _layer_settings('bench_max_threads')
+            self.bench_hash = _layer_settings('bench_hash', formatter=lambda x: [int(h) for h in x.split(',')])
+            self.bench_repeats = _layer_settings('bench_repeats')
+            self.bench_positions = _layer_settings('bench_positions')
+            self.bench_output = _layer_settings('bench_output')
+            self.bench_compare = _layer_settings('bench_compare')
+
+        self.harness_bench = _layer_settings('harness_bench')
+        if self.harness_bench:
+            self.harness_bench_games = _layer_settings('harness_bench_games')
+            self.harness_bench_concurrency = _layer_settings('harness_bench_concurrency')
+            self.harness_bench_output = _layer_settings('harness_bench_output')
+            self.harness_bench_compare = _layer_settings('harness_bench_compare')
+
+        self.perft = _layer_settings('perft')
+        if self.perft:
+            self.perft_depth = _layer_settings('perft_depth')
+            self.perft_suite = _layer_settings('perft_suite')
+            self.perft_command = _layer_settings('perft_command')
+            self.perft_timeout = _layer_settings('perft_timeout')
+
+        self.build_book = _layer_settings('build_book')
+        if self.build_book:
+            self.book_pgns = [x.strip() for x in _layer_settings('book_pgns', formatter=lambda x: x.split(','))]
+            self.book_output = _layer_settings('book_output')
+            self.book_max_ply = _layer_settings('book_max_ply')
+            self.book_min_games = _layer_settings('book_min_games')
+            self.book_results = _layer_settings('book_results')
+            self.book_workers = _layer_settings('book_workers')
+
+        self.annotate = _layer_settings('annotate')
+        if self.annotate:
+            self.annotate_pgn = _layer_settings('annotate_pgn')
+            self.annotate_output = _layer_settings('annotate_output')
+            self.annotate_format = _layer_settings('annotate_format')
+            self.annotate_nodes = _layer_settings('annotate_nodes')
+            self.annotate_movetime = _layer_settings('annotate_movetime')
+            self.annotate_workers = _layer_settings('annotate_workers')
+
+        self.adjudication = {
+            'resign_score': _layer_settings('adjudicate_resign_score'),
+            'resign_plies': _layer_settings('adjudicate_resign_plies'),
+            'draw_score': _layer_settings('adjudicate_draw_score'),
+            'draw_plies': _layer_settings('adjudicate_draw_plies'),
+            'draw_min_ply': _layer_settings('adjudicate_draw_min_ply'),
+        }
+
     def verify(self):
         # return false if something crucial is missing
-        if self.engine is None:
+        engine_tests = self.run_games or self.run_puzzles or self.compare_elo or self.analyze \
+            or self.selfplay or self.bench or self.perft or self.annotate
+        if engine_tests and self.engine is None:
             # no engine
             return False, "Missing engine"
-        if not self.run_games and not self.run_puzzles and not self.compare_elo:
+        # calibrating on its own reports the reference figure for this machine
+        calibrate_only = self.calibrate and self.calibration_engine is not None
+        if not engine_tests and not self.harness_bench and not self.build_book and not calibrate_only:
             # we're not testing anything
             return False, "No tests"
+        if self.calibrate and self.reference_nps and self.calibration_engine is None:
+            # the tested engine getting faster would shrink everyone's time
+            return False, "--reference-nps needs the --calibration-engine that measured it"
+        if self.build_book:
+            if not self.book_pgns:
+                return False, "No PGN files to build a book from"
+            if self.book_results not in RESULT_FILTERS:
+                return False, f"Book result filter must be one of {', '.join(RESULT_FILTERS)}"
+        if self.annotate:
+            if not self.annotate_pgn:
+                return False, "No PGN file to annotate"
+            if self.annotate_format not in ANNOTATE_FORMATS:
+                return False, f"Annotation format must be one of {', '.join(ANNOTATE_FORMATS)}"
+        if self.perft:
+            if self.perft_depth < 1:
+                return False, "Perft depth must be at least 1"
         if self.run_games:
             if not self.vs_engines:
                 return False, "No opponent engines"
-        if self.run_puzzles:
+        if self.run_puzzles or self.analyze:
             if not self.puzzle_suite:
                 return False, "No puzzles specified"
 
@@ -161,6 +425,22 @@ def get_settings():
         'config': args.config,
         'no_config': args.no_config,
         'engine_settings': args.engine_settings,
+        'cache_dir': args.cache_dir,
+        'concurrency': args.concurrency,
+        'no_pin_cpus': args.no_pin_cpus,
+        'memory_budget_mb': args.memory_budget_mb,
+        'metrics_port': args.metrics_port,
+        'metrics_file': args.metrics_file,
+        'metrics_interval': args.metrics_interval,
+        'monitor_interval': args.monitor_interval,
+        'engine_max_rss_mb': args.engine_max_rss_mb,
+        'engine_max_threads': args.engine_max_threads,
+        'no_preflight': args.no_preflight,
+        'preflight_timeout': args.preflight_timeout,
+        'calibrate': args.calibrate,
+        'calibration_engine': args.calibration_engine,
+        'calibration_movetime': args.calibration_movetime,
+        'reference_nps': args.reference_nps,
         'run_games': args.run_games,
         'engine_dir': args.engine_dir,
         'all_engines': args.all_engines,
@@ -168,6 +448,7 @@ def get_settings():
         'opening_book': args.opening_book,
         'opening_book_max_ply': args.opening_book_max_ply,
         'opening_fen': args.opening_fen,
+        'game_store': args.game_store,
         'clock_time': args.clock_time,
         'clock_inc': args.clock_inc,
         'run_puzzles': args.run_puzzles,
@@ -177,7 +458,55 @@ def get_settings():
         'rival_engine': args.rival_engine,
         'elo_clock_time': args.elo_clock_time,
         'elo_inc': args.elo_inc,
-        'elo_rounds': args.elo_rounds
+        'elo_rounds': args.elo_rounds,
+        'analyze': args.analyze,
+        'analysis_multipv': args.analysis_multipv,
+        'analysis_output': args.analysis_output,
+        'selfplay': args.selfplay,
+        'selfplay_games': args.selfplay_games,
+        'selfplay_nodes': args.selfplay_nodes,
+        'selfplay_random_plies': args.selfplay_random_plies,
+        'selfplay_output': args.selfplay_output,
+        'selfplay_workers': args.selfplay_workers,
+        'selfplay_seed': args.selfplay_seed,
+        'adjudicate_resign_score': args.adjudicate_resign_score,
+        'adjudicate_resign_plies': args.adjudicate_resign_plies,
+        'adjudicate_draw_score': args.adjudicate_draw_score,
+        'adjudicate_draw_plies': args.adjudicate_draw_plies,
+        'adjudicate_draw_min_ply': args.adjudicate_draw_min_ply,
+        'bench': args.bench,
+        'bench_depth': args.bench_depth,
+        'bench_movetime': args.bench_movetime,
+        'bench_max_threads': args.bench_max_threads,
+        'bench_hash': args.bench_hash,
+        'bench_repeats': args.bench_repeats,
+        'bench_positions': args.bench_positions,
+        'bench_output': args.bench_output,
+        'bench_compare': args.bench_compare,
+        'harness_bench': args.harness_bench,
+        'harness_bench_games': args.harness_bench_games,
+        'harness_bench_concurrency': args.harness_bench_concurrency,
+        'harness_bench_output': args.harness_bench_output,
+        'harness_bench_compare': args.harness_bench_compare,
+        'perft': args.perft,
+        'perft_depth': args.perft_depth,
+        'perft_suite': args.perft_suite,
+        'perft_command': args.perft_command,
+        'perft_timeout': args.perft_timeout,
+        'build_book': args.build_book,
+        'book_pgns': args.book_pgns,
+        'book_output': args.book_output,
+        'book_max_ply': args.book_max_ply,
+        'book_min_games': args.book_min_games,
+        'book_results': args.book_results,
+        'book_workers': args.book_workers,
+        'annotate': args.annotate,
+        'annotate_pgn': args.annotate_pgn,
+        'annotate_output': args.annotate_output,
+        'annotate_format': args.annotate_format,
+        'annotate_nodes': args.annotate_nodes,
+        'annotate_movetime': args.annotate_movetime,
+        'annotate_workers': args.annotate_workers
     }
 
     return Settings(arg_settings)
@@ -192,6 +521,30 @@ def get_settings_arg_parser():
     parser.add_argument("--config", default=None, help="Config file to apply")
     parser.add_argument("--no-config", action="store_true", help="Don't use a config file")
     parser.add_argument("--engine-settings", default=None, help="JSON string specifying all options to set for engines")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Directory for caching parsed suites and other precomputed data")
+
+    # resources
+    parser.add_argument("--concurrency", type=int, default=None, help="Number of games to run at once.  Defaults to the number of physical cores")
+    parser.add_argument("--no-pin-cpus", default=None, action="store_true", help="Don't pin engines to the cores of their game slot")
+    parser.add_argument("--memory-budget-mb", type=int, default=None, help="Memory to split between engine hash tables.  Without it engines keep their own Hash setting")
+
+    # monitoring
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve live Prometheus metrics on this local port")
+    parser.add_argument("--metrics-file", type=str, default=None, help="Periodically rewrite this file with Prometheus metrics")
+    parser.add_argument("--metrics-interval", type=int, default=None, help="Seconds between metrics file rewrites")
+    parser.add_argument("--monitor-interval", type=float, default=None, help="Seconds between engine resource samples.  0 disables sampling")
+    parser.add_argument("--engine-max-rss-mb", type=int, default=None, help="Kill and forfeit an engine whose resident memory grows past this")
+    parser.add_argument("--engine-max-threads", type=int, default=None, help="Kill and forfeit an engine that runs more threads than this")
+
+    # preflight
+    parser.add_argument("--no-preflight", default=None, action="store_true", help="Don't start and check every engine before running")
+    parser.add_argument("--preflight-timeout", type=float, default=None, help="Seconds to wait for all engines to finish the uci handshake")
+
+    # machine speed normalization
+    parser.add_argument("--calibrate", default=None, action="store_true", help="Measure this machine's speed first and scale all time controls to match --reference-nps")
+    parser.add_argument("--calibration-engine", type=str, default=None, help="Fixed reference engine to measure machine speed with.  Required with --reference-nps")
+    parser.add_argument("--calibration-movetime", type=int, default=None, help="Milliseconds per position when calibrating")
+    parser.add_argument("--reference-nps", type=int, default=None, help="Calibration engine nps on the reference machine")
 
     # games
     parser.add_argument("--run-games", default=None, action="store_true", help="Give engine a guantlet of games")
@@ -206,6 +559,9 @@ def get_settings_arg_parser():
     parser.add_argument("--opening-book-max-ply", type=int, default=None, help="polyglot opening book for games")
     parser.add_argument("--opening-fen", type=str, default=None, help="opening position to use for games.  Overrides any opening book")
 
+    ## game recording
+    parser.add_argument("--game-store", type=str, default=None, help="file to append finished games to in compact binary form")
+
     ## time controls
     parser.add_argument("--clock-time", type=int, default=None, help="clock time to start with for each engine in milliseconds")
     parser.add_argument("--clock-inc", type=int, default=None, help="increment for each move in milliseconds")
@@ -233,4 +589,110 @@ def get_settings_arg_parser():
 
     parser.add_argument("--elo-rounds", type=int, default=None, help="Number of rounds to play for ELO comparison.")
 
+
+    # MultiPV analysis
+    parser.add_argument("--analyze", default=None, action="store_true", help="Record the engine's top moves for each position in the puzzle suite.")
+
+    parser.add_argument("--analysis-multipv", type=int, default=None, help="Number of principal variations (MultiPV) to record per position.")
+
+    parser.add_argument("--analysis-output", type=str, default=None, help="JSON lines file to stream analysis results to.")
+
+    # self-play training data
+    parser.add_argument("--selfplay", default=None, action="store_true", help="Generate self-play training data as packed binary records.")
+
+    parser.add_argument("--selfplay-games", type=int, default=None, help="Total number of self-play games to generate.")
+
+    parser.add_argument("--selfplay-nodes", type=int, default=None, help="Node limit for each self-play search.")
+
+    parser.add_argument("--selfplay-random-plies", type=int, default=None, help="Number of random plies to play before the engine takes over.")
+
+    parser.add_argument("--selfplay-output", type=str, default=None, help="Directory to write binary training data shards to.")
+
+    parser.add_argument("--selfplay-workers", type=int, default=None, help="Number of parallel self-play processes.  Defaults to the number of cores.")
+
+    parser.add_argument("--selfplay-seed", type=int, default=None, help="Random seed for opening plies.")
+
+    # adjudication
+    parser.add_argument("--adjudicate-resign-score", type=int, default=None, help="Centipawn score past which a game is adjudicated as won.")
+
+    parser.add_argument("--adjudicate-resign-plies", type=int, default=None, help="Consecutive plies past the resign score needed to adjudicate a win.  0 disables.")
+
+    parser.add_argument("--adjudicate-draw-score", type=int, default=None, help="Centipawn score within which a game is considered drawn.")
+
+    parser.add_argument("--adjudicate-draw-plies", type=int, default=None, help="Consecutive plies within the draw score needed to adjudicate a draw.  0 disables.")
+
+    parser.add_argument("--adjudicate-draw-min-ply", type=int, default=None, help="Earliest ply at which a draw may be adjudicated.")
+
+    # engine speed bench
+    parser.add_argument("--bench", default=None, action="store_true", help="Measure engine speed and thread scaling over a fixed set of positions.")
+
+    parser.add_argument("--bench-depth", type=int, default=None, help="Search each bench position to this depth.  Overrides --bench-movetime.")
+
+    parser.add_argument("--bench-movetime", type=int, default=None, help="Milliseconds to search each bench position.")
+
+    parser.add_argument("--bench-max-threads", type=int, default=None, help="Largest thread count to bench.  Powers of two up to this are used.  Defaults to the number of cores.")
+
+    parser.add_argument("--bench-hash", type=str, default=None, help="Comma separated list of hash sizes in MB to bench.")
+
+    parser.add_argument("--bench-repeats", type=int, default=None, help="Number of times to repeat each configuration.")
+
+    parser.add_argument("--bench-positions", type=str, default=None, help="EPD file of positions to bench instead of the built in set.")
+
+    parser.add_argument("--bench-output", type=str, default=None, help="JSON file to save bench results to.")
+
+    parser.add_argument("--bench-compare", type=str, default=None, help="Previously saved bench results to compare against.")
+
+    # harness overhead bench
+    parser.add_argument("--harness-bench", default=None, action="store_true", help="Measure endian's own overhead against instant mock engines.  No real engine needed.")
+
+    parser.add_argument("--harness-bench-games", type=int, default=None, help="Number of mock games to time.")
+
+    parser.add_argument("--harness-bench-concurrency", type=int, default=None, help="Number of simultaneous games for the memory measurement.")
+
+    parser.add_argument("--harness-bench-output", type=str, default=None, help="JSON file to save harness bench results to.")
+
+    parser.add_argument("--harness-bench-compare", type=str, default=None, help="Previously saved harness bench results to compare against.")
+
+    # perft
+    parser.add_argument("--perft", default=None, action="store_true", help="Check the engine's move generation counts and speed with perft.")
+
+    parser.add_argument("--perft-depth", type=int, default=None, help="Depth to run perft to.")
+
+    parser.add_argument("--perft-suite", type=str, default=None, help="File of FENs to run perft on instead of the built in set.")
+
+    parser.add_argument("--perft-command", type=str, default=None, help="Command that starts a perft, with {depth} filled in.  Defaults to 'go perft {depth}'.")
+
+    parser.add_argument("--perft-timeout", type=float, default=None, help="Seconds to wait for a perft on top of the time its node count should take.")
+
+    # opening book building
+    parser.add_argument("--build-book", default=None, action="store_true", help="Build a polyglot opening book from PGN files.  No engine needed.")
+
+    parser.add_argument("--book-pgns", type=str, default=None, help="Comma separated list of PGN files to build the book from.")
+
+    parser.add_argument("--book-output", type=str, default=None, help="Polyglot .bin file to write.")
+
+    parser.add_argument("--book-max-ply", type=int, default=None, help="Only include moves up to this ply.")
+
+    parser.add_argument("--book-min-games", type=int, default=None, help="Only include moves played in at least this many games.")
+
+    parser.add_argument("--book-results", type=str, default=None, help="Which moves count: all, no-losses (skip moves by the losing side) or wins (only moves by the winner).")
+
+    parser.add_argument("--book-workers", type=int, default=None, help="Number of processes parsing PGN in parallel.  Defaults to --concurrency.")
+
+
+    # bulk annotation
+    parser.add_argument("--annotate", default=None, action="store_true", help="Evaluate every position of a PGN file and write the games back out annotated.")
+
+    parser.add_argument("--annotate-pgn", type=str, default=None, help="PGN file with the games to annotate.")
+
+    parser.add_argument("--annotate-output", type=str, default=None, help="File to write annotated games to.")
+
+    parser.add_argument("--annotate-format", type=str, default=None, help="pgn (eval and pv comments) or jsonl (one line per position).")
+
+    parser.add_argument("--annotate-nodes", type=int, default=None, help="Nodes to search per position.")
+
+    parser.add_argument("--annotate-movetime", type=int, default=None, help="Milliseconds to search per position.  Overrides --annotate-nodes.")
+
+    parser.add_argument("--annotate-workers", type=int, default=None, help="Number of engines searching at once.  Defaults to --concurrency.")
+
     return parser
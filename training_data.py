@@ -0,0 +1,109 @@
+import os
+import struct
+
+import chess
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# one fixed size record per position, little endian:
+#   pieces  32 bytes  two squares per byte (a1 in the low nibble of byte 0),
+#                     0 is empty, 1-6 white pawn..king, 7-12 black pawn..king
+#   flags   u8        bit 0 side to move is black, bits 1-4 castling KQkq
+#   ep      u8        en passant square or 255
+#   score   i16       centipawns from the side to move's point of view
+#   result  i8        1 / 0 / -1 from the side to move's point of view
+#   (pad)   u8
+#   ply     u16       ply of the game this position occurred on
+RECORD_STRUCT = struct.Struct("<32sBBhbxH")
+RECORD_SIZE = RECORD_STRUCT.size
+
+if numpy is not None:
+    RECORD_DTYPE = numpy.dtype([
+        ('pieces', 'u1', (32,)),
+        ('flags', 'u1'),
+        ('ep', 'u1'),
+        ('score', '<i2'),
+        ('result', 'i1'),
+        ('pad', 'u1'),
+        ('ply', '<u2'),
+    ])
+    assert RECORD_DTYPE.itemsize == RECORD_SIZE
+
+NO_EP = 255
+SCORE_LIMIT = 32000
+
+
+def _piece_code(piece):
+    return piece.piece_type + (0 if piece.color == chess.WHITE else 6)
+
+
+def pack_position(board, score, result, ply):
+    squares = [0] * 64
+    for square, piece in board.piece_map().items():
+        squares[square] = _piece_code(piece)
+    pieces = bytes(squares[i] | (squares[i + 1] << 4) for i in range(0, 64, 2))
+
+    flags = 0 if board.turn == chess.WHITE else 1
+    if board.has_kingside_castling_rights(chess.WHITE):
+        flags |= 2
+    if board.has_queenside_castling_rights(chess.WHITE):
+        flags |= 4
+    if board.has_kingside_castling_rights(chess.BLACK):
+        flags |= 8
+    if board.has_queenside_castling_rights(chess.BLACK):
+        flags |= 16
+
+    ep = board.ep_square if board.ep_square is not None else NO_EP
+    score = max(-SCORE_LIMIT, min(SCORE_LIMIT, score))
+    return RECORD_STRUCT.pack(pieces, flags, ep, score, result, ply)
+
+
+def unpack_position(data):
+    # mostly useful for debugging, bulk consumers should use load_shard
+    pieces, flags, ep, score, result, ply = RECORD_STRUCT.unpack(data)
+    board = chess.Board(None)
+    for i, byte in enumerate(pieces):
+        for square, code in ((2 * i, byte & 0xf), (2 * i + 1, byte >> 4)):
+            if code:
+                color = chess.WHITE if code <= 6 else chess.BLACK
+                board.set_piece_at(square, chess.Piece(code - (0 if color == chess.WHITE else 6), color))
+
+    board.turn = chess.BLACK if flags & 1 else chess.WHITE
+    castling = 0
+    for bit, rook_square in ((2, chess.H1), (4, chess.A1), (8, chess.H8), (16, chess.A8)):
+        if flags & bit:
+            castling |= chess.BB_SQUARES[rook_square]
+    board.castling_rights = castling
+    board.ep_square = None if ep == NO_EP else ep
+    return board, score, result, ply
+
+
+def write_records(fname, records):
+    with open(fname, "ab") as f:
+        f.write(b''.join(records))
+
+
+def load_shard(fname):
+    # memory mapped, so nothing is read until it is touched
+    if numpy is None:
+        raise ImportError("numpy is required to load training data shards")
+    if os.path.getsize(fname) % RECORD_SIZE != 0:
+        raise ValueError(f"{fname} is not a whole number of {RECORD_SIZE} byte records")
+    return numpy.memmap(fname, dtype=RECORD_DTYPE, mode="r")
+
+
+def load_shards(dirname):
+    fnames = sorted(f for f in os.listdir(dirname) if f.endswith(".bin"))
+    return [load_shard(os.path.join(dirname, f)) for f in fnames]
+
+
+def unpack_pieces(records):
+    # (N, 64) piece codes from a slice of records
+    pieces = records['pieces']
+    squares = numpy.empty(pieces.shape[:-1] + (64,), dtype=numpy.uint8)
+    squares[..., 0::2] = pieces & 0xf
+    squares[..., 1::2] = pieces >> 4
+    return squares